@@ -1,25 +1,155 @@
-from flask import Flask, flash, redirect, render_template, request, session, url_for, jsonify
-import mysql.connector, random, string, os
-from werkzeug.utils import secure_filename
-from predict import process_xray
-from datetime import datetime, timedelta
-from mistralai import Mistral
+from flask import Flask, Response, abort, flash, g, make_response, redirect, render_template, request, send_file, session, stream_with_context, url_for, jsonify
+import hashlib, json, multiprocessing, random, string, os, time
+from jobs import InferenceScheduler, QueueFullError
+from inference_pool import InferencePool
+import metrics
+from db import ConnectionPool, mysql_factory, sqlite_factory
+from appointments import AppointmentIndex, SlotConflict
+from query_cache import TTLCache
+from chat import ChatService
 
 app = Flask(__name__)
 app.secret_key = "Qazwsx@123"
 
 # Configure upload settings
 UPLOAD_FOLDER = 'static/uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+# Images plus the DICOM/TIFF extensions in ingest.EXTENSIONS (not imported, it pulls in numpy)
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'dcm', 'dicom', 'tif', 'tiff'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Database connection
-link = mysql.connector.connect(
-    host = 'localhost',
-    user = 'root',
-    password = '',
-    database = 'bonefracture'
+# predict pulls in OpenCV, ultralytics and torch. It is imported on first use so
+# that web workers start quickly; with INFERENCE_WORKERS set it is only ever
+# loaded by the pool processes (plus OpenCV here, to render /processed views).
+def inference():
+    import predict
+    # Artifact garbage collection runs in the web process, from the first use of the store
+    predict.view_store.start_gc()
+    return predict
+
+def process_xray_batch(images):
+    return inference().process_xray_batch(images)
+
+def original_url(processed_url):
+    view_store = inference().view_store
+    return view_store.url('original', view_store.key_from_url(processed_url))
+
+# Inference runs on a background scheduler that groups concurrent uploads into micro-batches
+INFERENCE_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT', 120))
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0))
+inference_pool = None
+# Spawned pool workers re-import this module, only the parent process may start the pool
+if INFERENCE_WORKERS > 0 and multiprocessing.parent_process() is None:
+    # Workers load the model and warm up now instead of on the first upload
+    # A batch whose worker died fails after INFERENCE_TIMEOUT instead of blocking the scheduler
+    inference_pool = InferencePool(INFERENCE_WORKERS, int(os.environ.get('INFERENCE_THREADS', 1)),
+                                   task_timeout=INFERENCE_TIMEOUT)
+scheduler = InferenceScheduler(
+    inference_pool.detect_batch if inference_pool else process_xray_batch,
+    max_batch_size = int(os.environ.get('INFERENCE_BATCH_SIZE', 8)),
+    max_wait = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 10)) / 1000,
+    max_queue = int(os.environ.get('INFERENCE_QUEUE_SIZE', 64)),
+    # One batch in flight per pool worker; the in-process model runs one batch at a time
+    concurrency = INFERENCE_WORKERS if inference_pool else 1
 )
+metrics.registry.gauge('fracture_inference_queue_depth', 'Uploads waiting for the inference scheduler',
+                       callback=scheduler.pending)
+request_seconds = metrics.registry.histogram('http_request_seconds', 'Time spent handling requests, by endpoint')
+
+@app.before_request
+def start_request_timer():
+    g.start_time = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.get('start_time')
+    if start is not None:
+        request_seconds.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown')
+    return response
+
+# Database connections: each request checks one out of the pool and returns it on teardown.
+# Set SQLITE_DATABASE to run against a local SQLite file instead of MySQL.
+if os.environ.get('SQLITE_DATABASE'):
+    db_factory = sqlite_factory(os.environ['SQLITE_DATABASE'])
+else:
+    db_factory = mysql_factory(
+        host = os.environ.get('DB_HOST', 'localhost'),
+        user = os.environ.get('DB_USER', 'root'),
+        password = os.environ.get('DB_PASSWORD', ''),
+        database = os.environ.get('DB_NAME', 'bonefracture')
+    )
+db_pool = ConnectionPool(
+    db_factory,
+    size = int(os.environ.get('DB_POOL_SIZE', 10)),
+    timeout = float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    health_check_interval = float(os.environ.get('DB_HEALTH_CHECK_INTERVAL', 30))
+)
+
+def get_db():
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+# Per-doctor, per-day calendar used to check booking conflicts
+appointment_index = AppointmentIndex()
+
+# Read-through cache for the doctor directory and appointment listings. Writers
+# invalidate by tag: 'doctors', 'appointments:user:<id>', 'appointments:doctor:<id>'.
+query_cache = TTLCache(
+    max_entries = int(os.environ.get('QUERY_CACHE_SIZE', 1024)),
+    ttl = float(os.environ.get('QUERY_CACHE_TTL', 30))
+)
+LISTING_PAGE_SIZE = int(os.environ.get('LISTING_PAGE_SIZE', 100))
+
+# /api/predict: integration partners authenticate with one of API_KEYS (comma
+# separated) as a Bearer token or X-API-Key header; logged-in users need none
+API_KEYS = {key.strip() for key in os.environ.get('API_KEYS', '').split(',') if key.strip()}
+API_MAX_IMAGES = int(os.environ.get('API_MAX_IMAGES', 16))
+API_VIEWS = ('original', 'processed', 'grayscale', 'thresholded', 'binary')
+
+def api_authorized():
+    if 'user' in session:
+        return True
+    auth = request.headers.get('Authorization', '')
+    key = auth[7:] if auth.startswith('Bearer ') else request.headers.get('X-API-Key')
+    return bool(key) and key in API_KEYS
+
+# One Mistral client for the whole process plus a cache of answers to repeated
+# questions. MISTRAL_SERVER_URL points it at a local stub server for testing.
+chat_service = ChatService(
+    api_key = os.environ.get('MISTRAL_API_KEY', "WTuMOibXWmpTqjvscYHSaaCOjjXCakkJ"), # Replace with secure storage method
+    model = os.environ.get('MISTRAL_MODEL', "mistral-large-latest"),
+    server_url = os.environ.get('MISTRAL_SERVER_URL') or None,
+    cache_size = int(os.environ.get('CHAT_CACHE_SIZE', 512)),
+    cache_ttl = float(os.environ.get('CHAT_CACHE_TTL', 3600))
+)
+
+def cached_query(key, tags, sql, params):
+    def load():
+        cursor = get_db().cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    return query_cache.get_or_load(key, load, tags)
+
+def render_conditional(data, template, **context):
+    # ETag over the data behind the page; pending flash messages change the page too
+    flashes = session.get('_flashes')
+    etag = hashlib.sha1(repr((data, flashes)).encode()).hexdigest()
+    if not flashes and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template(template, **context))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -37,7 +167,7 @@ def login():
         return render_template('login.html')
 
     else:
-        cursor = link.cursor()
+        cursor = get_db().cursor()
         try:
             email = request.form["email"]
             password = request.form["password"]
@@ -66,7 +196,7 @@ def register():
         return render_template('register.html')
 
     else:
-        cursor = link.cursor()
+        cursor = get_db().cursor()
         try:
             name = request.form["name"]
             email = request.form["email"]
@@ -82,7 +212,7 @@ def register():
             else:
                 cursor.execute("INSERT INTO users (uid, name, email, password, phone) VALUES (%s, %s, %s, %s, %s)",
                              (uid, name, email, password, phone))
-                link.commit()
+                get_db().commit()
                 return render_template('register.html', success='Registration successful')
 
         except Exception as e:
@@ -100,7 +230,7 @@ def doctor_register():
         return render_template('doctor_register.html')
 
     else:
-        cursor = link.cursor()
+        cursor = get_db().cursor()
         try:
             name = request.form["name"]
             name = request.form["name"]
@@ -118,7 +248,8 @@ def doctor_register():
             else:
                 cursor.execute("INSERT INTO doctors (uid, name, email, password, phone, specialization) VALUES (%s, %s, %s, %s, %s, %s)",
                              (uid, name, email, password, phone, specialization))
-                link.commit()
+                get_db().commit()
+                query_cache.invalidate('doctors')
                 return render_template('doctor_register.html', success='Registration successful')
 
         except Exception as e:
@@ -136,7 +267,7 @@ def doctor_login():
         return render_template('doctor_login.html')
 
     else:
-        cursor = link.cursor()
+        cursor = get_db().cursor()
         try:
             email = request.form["email"]
             password = request.form["password"]
@@ -172,16 +303,17 @@ def enquiry():
         return render_template('enquiry.html', error='No file selected')
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(filepath)
-
         try:
-            processed_image, grayscale_image, thresholded_image, binary_image, result = process_xray(filepath)
+            # Decode straight from the upload buffer; the original is persisted in the background
+            job = scheduler.submit(file.read())
+            if not job.wait(INFERENCE_TIMEOUT):
+                return render_template('enquiry.html', error='The image is still being processed, please try again shortly')
+            if job.error:
+                return render_template('enquiry.html', error=job.error)
+            processed_image, grayscale_image, thresholded_image, binary_image, result = job.result
             if processed_image:
                 return render_template('enquiry.html',
-                                     original_image=filepath,
+                                     original_image=original_url(processed_image),
                                      grayscale_image=grayscale_image,
                                      thresholded_image=thresholded_image,
                                      binary_image=binary_image,
@@ -189,39 +321,206 @@ def enquiry():
                                      result=result)
             else:
                 return render_template('enquiry.html', error='Error processing image')
+        except QueueFullError as e:
+            return render_template('enquiry.html', error=str(e)), 503
         except Exception as e:
             return render_template('enquiry.html', error=str(e))
 
     return render_template('enquiry.html', error='Invalid file type')
 
+def job_payload(job):
+    payload = {"job_id": job.id, "status": job.status}
+    if job.error:
+        payload["error"] = job.error
+    elif job.result:
+        processed_image, grayscale_image, thresholded_image, binary_image, result = job.result
+        if processed_image is None:
+            payload["status"] = 'failed'
+            payload["error"] = result
+        else:
+            payload["result"] = {
+                "original_image": original_url(processed_image),
+                "processed_image": processed_image,
+                "grayscale_image": grayscale_image,
+                "thresholded_image": thresholded_image,
+                "binary_image": binary_image,
+                "result": str(result),
+                "detections": result.to_list()
+            }
+    return payload
+
+@app.route('/enquiry/jobs', methods=['POST'])
+def submit_enquiry_job():
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({"error": "No file uploaded"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "Invalid file type"}), 400
+
+    try:
+        job = scheduler.submit(file.read())
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+    # Optionally block until the job finishes (submit/wait), otherwise poll the job URL
+    wait = request.args.get('wait', type=float)
+    if wait:
+        job.wait(min(wait, INFERENCE_TIMEOUT))
+    payload = job_payload(job)
+    payload["poll_url"] = url_for('enquiry_job_status', job_id=job.id)
+    return jsonify(payload), 200 if job.done() else 202
+
+@app.route('/enquiry/jobs/<job_id>')
+def enquiry_job_status(job_id):
+    if 'user' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_payload(job)), 200 if job.done() else 202
+
+def api_views():
+    # ?views=processed,binary or ?views=all; returns None for unknown view names
+    views = [v for v in request.args.get('views', '').split(',') if v]
+    if views == ['all']:
+        return list(API_VIEWS)
+    return views if all(v in API_VIEWS for v in views) else None
+
+def api_result(job, filename, views):
+    # Structured result for one image: detections always, view URLs on request
+    if not job.done():
+        return {"filename": filename, "status": 'pending', "job_id": job.id,
+                "poll_url": url_for('api_job_status', job_id=job.id, views=','.join(views) or None)}
+    if job.error:
+        return {"filename": filename, "status": 'error', "error": job.error}
+    processed_image, grayscale_image, thresholded_image, binary_image, result = job.result
+    if processed_image is None:
+        return {"filename": filename, "status": 'error', "error": result}
+    payload = {
+        "filename": filename,
+        "status": 'ok',
+        "width": result.width,
+        "height": result.height,
+        "detections": result.to_list()
+    }
+    if views:
+        urls = {"original": original_url(processed_image), "processed": processed_image,
+                "grayscale": grayscale_image, "thresholded": thresholded_image, "binary": binary_image}
+        payload["views"] = {view: urls[view] for view in views}
+    return payload
+
+@app.route('/api/predict', methods=['POST'])
+def api_predict():
+    # Multipart upload of one or more images (fields "file" or "files"), or a
+    # single image as the raw request body. ?views=processed,binary or
+    # ?views=all adds URLs of derived images, which are rendered when fetched.
+    if not api_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    views = api_views()
+    if views is None:
+        return jsonify({"error": "Unknown view requested", "views": list(API_VIEWS)}), 400
+
+    uploads = [(f.filename, f) for f in request.files.getlist('file') + request.files.getlist('files')]
+    if not uploads and request.content_length and request.mimetype != 'multipart/form-data':
+        uploads = [(request.args.get('filename'), None)]
+    if not uploads:
+        return jsonify({"error": "No file uploaded"}), 400
+    if len(uploads) > API_MAX_IMAGES:
+        return jsonify({"error": f"At most {API_MAX_IMAGES} images per request"}), 413
+    for filename, f in uploads:
+        if f is not None and not allowed_file(f.filename):
+            return jsonify({"error": f"Invalid file type: {filename}"}), 400
+
+    jobs = []
+    try:
+        for filename, f in uploads:
+            jobs.append((filename, scheduler.submit(f.read() if f is not None else request.get_data())))
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+    # The scheduler batches these with any other uploads in flight
+    deadline = time.monotonic() + min(request.args.get('timeout', INFERENCE_TIMEOUT, type=float), INFERENCE_TIMEOUT)
+    for _, job in jobs:
+        job.wait(max(0, deadline - time.monotonic()))
+    results = [api_result(job, filename, views) for filename, job in jobs]
+    status = 202 if any(r["status"] == 'pending' for r in results) else 200
+    return jsonify({"count": len(results), "results": results}), status
+
+@app.route('/api/predict/jobs/<job_id>')
+def api_job_status(job_id):
+    if not api_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    views = api_views()
+    if views is None:
+        return jsonify({"error": "Unknown view requested", "views": list(API_VIEWS)}), 400
+    return jsonify(api_result(job, None, views)), 200 if job.done() else 202
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return metrics.registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/processed/<view>/<key>')
+def processed_view(view, key):
+    if not api_authorized():
+        return redirect(url_for('login'))
+
+    # Views are rendered on first access and then served from disk
+    view_store = inference().view_store
+    try:
+        path = view_store.get(view, key)
+    except KeyError:
+        abort(404)
+    return send_file(path, mimetype=view_store.mimetype_of(path), max_age=86400)
+
 @app.route('/doctors')
 def doctors():
     if 'user' not in session:
         return redirect(url_for('login'))
 
-    cursor = link.cursor()
     try:
-        # Fetch all doctors
-        cursor.execute("SELECT * FROM doctors")
-        doctors_list = cursor.fetchall()
+        # Fetch one page of doctors, keyset-paginated on id
+        after = request.args.get('after', 0, type=int)
+        doctors_list = cached_query(
+            ('doctors', after, LISTING_PAGE_SIZE), ('doctors',),
+            "SELECT * FROM doctors WHERE id > %s ORDER BY id LIMIT %s",
+            (after, LISTING_PAGE_SIZE + 1)
+        )
+        next_after = doctors_list[LISTING_PAGE_SIZE - 1][0] if len(doctors_list) > LISTING_PAGE_SIZE else None
+        doctors_list = doctors_list[:LISTING_PAGE_SIZE]
 
         # Fetch user's appointments with doctor names
         user_id = session['user_id']
-        cursor.execute("""
+        user_appointments = cached_query(
+            ('user_appointments', user_id), ('appointments', 'appointments:user:%s' % user_id),
+            """
             SELECT a.*, d.name
             FROM appointments a
             JOIN doctors d ON a.doctor_id = d.id
             WHERE a.user_id = %s
-        """, (user_id,))
-        user_appointments = cursor.fetchall()
+            """,
+            (user_id,)
+        )
 
-        return render_template('doctors.html', doctors=doctors_list, user_appointments=user_appointments)
+        return render_conditional((user_id, after, doctors_list, user_appointments), 'doctors.html',
+                                  doctors=doctors_list, user_appointments=user_appointments,
+                                  next_after=next_after, after=after)
 
     except Exception as e:
         error = str(e)
         return render_template('doctors.html', error=error)
-    finally:
-        cursor.close()
 
 @app.route('/book_appointment', methods=['POST'])
 def book_appointment():
@@ -234,44 +533,20 @@ def book_appointment():
         appointment_time = request.form['appointment_time']
         user_id = session['user_id']
 
-        cursor = link.cursor()
         try:
-            # Combine date and time for easier comparison
-            appointment_datetime = datetime.strptime(f"{appointment_date} {appointment_time}", "%Y-%m-%d %H:%M")
-            time_before = appointment_datetime - timedelta(minutes=29)
-            time_after = appointment_datetime + timedelta(minutes=29)
-
-            # Check for existing appointments within the 30-minute window
-            cursor.execute(
-                """
-                SELECT COUNT(*) FROM appointments
-                WHERE doctor_id = %s
-                AND appointment_date = %s
-                AND appointment_time BETWEEN %s AND %s
-                """,
-                (doctor_id, appointment_date, time_before.strftime("%H:%M:%S"), time_after.strftime("%H:%M:%S"))
-            )
-            existing_appointments_count = cursor.fetchone()[0]
-
-            if existing_appointments_count > 0:
-                flash('There is already an appointment scheduled within 30 minutes of this time.', 'danger')
-                return redirect(url_for('doctors'))
-
-            # If no conflicting appointments, insert the new appointment
-            cursor.execute(
-                "INSERT INTO appointments (user_id, doctor_id, appointment_date, appointment_time) VALUES (%s, %s, %s, %s)",
-                (user_id, doctor_id, appointment_date, appointment_time)
-            )
-            link.commit()
+            # Checks the 30-minute window and inserts atomically, see appointments.AppointmentIndex
+            appointment_index.book(get_db(), user_id, doctor_id, appointment_date, appointment_time)
+            query_cache.invalidate('appointments:user:%s' % user_id, 'appointments:doctor:%s' % doctor_id)
             flash('Appointment booked successfully!', 'success')
             return redirect(url_for('doctors'))
 
+        except SlotConflict:
+            flash('There is already an appointment scheduled within 30 minutes of this time.', 'danger')
+            return redirect(url_for('doctors'))
         except Exception as e:
-            link.rollback()
+            get_db().rollback()
             flash(f'Error booking appointment: {str(e)}', 'danger')
             return redirect(url_for('doctors'))
-        finally:
-            cursor.close()
 
 @app.route('/logout')
 def logout():
@@ -298,28 +573,39 @@ def chatbot():
     if not user_message:
         return jsonify({"error": "No message provided"}), 400
 
-    api_key = "WTuMOibXWmpTqjvscYHSaaCOjjXCakkJ" # Replace with secure storage method
-    model = "mistral-large-latest"
+    if request.args.get('stream') == '1' or 'text/event-stream' in request.headers.get('Accept', ''):
+        return chatbot_stream(user_message)
 
     try:
-        client = Mistral(api_key=api_key)
-        messages = [
-            {"role": "system", "content": "You are a medical chatbot specializing in bones. Provide information and answer questions related to bone health, fractures, and related medical topics. Do not answer questions outside of this domain."},
-            {"role": "user", "content": user_message}
-        ]
-        chat_response = client.chat.complete(model=model, messages=messages)
-        bot_response = chat_response.choices[0].message.content
+        bot_response = chat_service.ask(user_message)
         return jsonify({"response": bot_response})
     except Exception as e:
-        print(f"Error in chatbot API call: {e}") # Add detailed logging
-        # Check for specific Mistral API errors if possible
-        if hasattr(e, 'response') and hasattr(e.response, 'text'):
-             print(f"Mistral API response error: {e.response.text}")
-             return jsonify({"error": f"Mistral API error: {e.response.text}"}), 500
-        elif isinstance(e, Exception): # Catch other potential exceptions
-             return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
-        else:
-             return jsonify({"error": "Could not get response from chatbot API."}), 500
+        return jsonify({"error": chatbot_error(e)}), 500
+
+def chatbot_error(e):
+    print(f"Error in chatbot API call: {e}") # Add detailed logging
+    # Check for specific Mistral API errors if possible
+    if hasattr(e, 'response') and hasattr(e.response, 'text'):
+        print(f"Mistral API response error: {e.response.text}")
+        return f"Mistral API error: {e.response.text}"
+    return f"An unexpected error occurred: {str(e)}"
+
+def chatbot_stream(user_message):
+    # Server-Sent Events: one "data" event per chunk of the answer, then a
+    # "done" event, or an "error" event if the API call fails part way
+    def events():
+        try:
+            for delta in chat_service.stream(user_message):
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': chatbot_error(e)})}\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/doctor_appointments')
 def doctor_appointments():
@@ -327,25 +613,44 @@ def doctor_appointments():
         return redirect(url_for('doctor_login'))
 
     doctor_id = session['doctor_user_id']
-    cursor = link.cursor()
     try:
+        # Keyset pagination on (date, time, id), served by the doctor_schedule index
+        after = request.args.get('after')
+        if after:
+            after_date, after_time, after_id = after.split('|')
+            page_filter = "AND (a.appointment_date, a.appointment_time, a.id) > (%s, %s, %s)"
+            params = (doctor_id, after_date, after_time, int(after_id), LISTING_PAGE_SIZE + 1)
+        else:
+            page_filter = ""
+            params = (doctor_id, LISTING_PAGE_SIZE + 1)
+
         # Fetch appointments for the logged-in doctor with user names
-        cursor.execute("""
+        doctor_appointments_list = cached_query(
+            ('doctor_appointments', doctor_id, after, LISTING_PAGE_SIZE), ('appointments', 'appointments:doctor:%s' % doctor_id),
+            """
             SELECT a.*, u.name
             FROM appointments a
             JOIN users u ON a.user_id = u.id
             WHERE a.doctor_id = %s
-            ORDER BY a.appointment_date, a.appointment_time
-        """, (doctor_id,))
-        doctor_appointments_list = cursor.fetchall()
-
-        return render_template('doctor_appointments.html', doctor_appointments=doctor_appointments_list)
+            """ + page_filter + """
+            ORDER BY a.appointment_date, a.appointment_time, a.id
+            LIMIT %s
+            """,
+            params
+        )
+        next_after = None
+        if len(doctor_appointments_list) > LISTING_PAGE_SIZE:
+            last = doctor_appointments_list[LISTING_PAGE_SIZE - 1]
+            next_after = '%s|%s|%s' % (last[3], last[4], last[0])
+        doctor_appointments_list = doctor_appointments_list[:LISTING_PAGE_SIZE]
+
+        return render_conditional((doctor_id, after, doctor_appointments_list), 'doctor_appointments.html',
+                                  doctor_appointments=doctor_appointments_list,
+                                  next_after=next_after, after=after)
 
     except Exception as e:
         error = str(e)
         return render_template('doctor_appointments.html', error=error)
-    finally:
-        cursor.close()
 
 @app.route('/update_appointment_status/<int:appointment_id>', methods=['POST'])
 def update_appointment_status(appointment_id):
@@ -357,27 +662,19 @@ def update_appointment_status(appointment_id):
         doctor_id = session['doctor_user_id']
 
         if status in ['accepted', 'rejected']:
-            cursor = link.cursor()
             try:
-                # Ensure the appointment belongs to the logged-in doctor
-                cursor.execute("SELECT doctor_id FROM appointments WHERE id = %s", (appointment_id,))
-                appointment = cursor.fetchone()
-
-                if appointment and appointment[0] == doctor_id:
-                    cursor.execute(
-                        "UPDATE appointments SET status = %s WHERE id = %s",
-                        (status, appointment_id)
-                    )
-                    link.commit()
+                # Only updates the appointment if it belongs to the logged-in doctor
+                if appointment_index.set_status(get_db(), appointment_id, status, doctor_id):
+                    query_cache.invalidate('appointments')
                     flash(f'Appointment {status} successfully!', 'success')
                 else:
                     flash('Appointment not found or does not belong to you.', 'danger')
 
+            except SlotConflict:
+                flash('Another appointment has been booked within 30 minutes of this one since it was rejected.', 'danger')
             except Exception as e:
-                link.rollback()
+                get_db().rollback()
                 flash(f'Error updating appointment status: {str(e)}', 'danger')
-            finally:
-                cursor.close()
         else:
             flash('Invalid status provided.', 'danger')
 
@@ -0,0 +1,239 @@
+import bisect
+import threading
+from datetime import date, datetime, timedelta
+
+# Two appointments for the same doctor conflict when they start within this
+# many seconds of each other (the old BETWEEN t-29min AND t+29min check)
+CONFLICT_WINDOW = 29 * 60
+DAY_SECONDS = 24 * 60 * 60
+
+
+class SlotConflict(Exception):
+    pass
+
+
+def _day(value):
+    # DATE columns come back as datetime.date from MySQL and as text from SQLite
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def _seconds(value):
+    # TIME columns come back as timedelta from MySQL and as 'HH:MM[:SS]' text from SQLite
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    parts = [int(p) for p in str(value).split(':')]
+    hours, minutes, seconds = (parts + [0, 0])[:3]
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _clock(seconds):
+    return '%02d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+class AppointmentIndex:
+    # In-memory calendar of blocking (not rejected) appointments: for every
+    # (doctor, day) a sorted list of (start second, appointment id), so a
+    # conflict check is a bisect instead of a table scan. Days are loaded
+    # from the database the first time they are touched and kept in step
+    # by book() and set_status(). The database stays authoritative: a free
+    # slot is re-checked under a row lock before inserting, and a conflict
+    # seen only in memory reloads the day first, so several app processes
+    # stay consistent.
+    def __init__(self):
+        self._days = {}
+        self._by_id = {}
+        self._loaded = set()
+        self._warmed_from = None
+        self._lock = threading.Lock()
+        self._doctor_locks = {}
+
+    def _doctor_lock(self, doctor_id):
+        with self._lock:
+            lock = self._doctor_locks.get(doctor_id)
+            if lock is None:
+                lock = self._doctor_locks[doctor_id] = threading.Lock()
+            return lock
+
+    def _add(self, appointment_id, doctor_id, day, seconds):
+        slots = self._days.setdefault((doctor_id, day), [])
+        bisect.insort(slots, (seconds, appointment_id))
+        self._by_id[appointment_id] = (doctor_id, day, seconds)
+
+    def _remove(self, appointment_id):
+        entry = self._by_id.pop(appointment_id, None)
+        if entry is None:
+            return
+        doctor_id, day, seconds = entry
+        slots = self._days.get((doctor_id, day), [])
+        i = bisect.bisect_left(slots, (seconds, appointment_id))
+        if i < len(slots) and slots[i] == (seconds, appointment_id):
+            del slots[i]
+
+    def warm(self, conn, from_day=None):
+        # Preloads every blocking appointment from from_day (default today) onwards
+        from_day = from_day or date.today().strftime('%Y-%m-%d')
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT id, doctor_id, appointment_date, appointment_time FROM appointments
+                WHERE appointment_date >= %s AND status <> 'rejected'
+                """,
+                (from_day,)
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        with self._lock:
+            for appointment_id, doctor_id, day, start in rows:
+                if appointment_id not in self._by_id:
+                    self._add(appointment_id, int(doctor_id), _day(day), _seconds(start))
+            self._warmed_from = from_day
+
+    def _is_loaded(self, doctor_id, day):
+        return (doctor_id, day) in self._loaded or (self._warmed_from is not None and day >= self._warmed_from)
+
+    def _ensure_day(self, conn, doctor_id, day):
+        with self._lock:
+            if self._is_loaded(doctor_id, day):
+                return
+        self._load_day(conn, doctor_id, day)
+
+    def _load_day(self, conn, doctor_id, day):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT id, appointment_time FROM appointments
+                WHERE doctor_id = %s AND appointment_date = %s AND status <> 'rejected'
+                """,
+                (doctor_id, day)
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        with self._lock:
+            for _, appointment_id in self._days.get((doctor_id, day), []):
+                self._by_id.pop(appointment_id, None)
+            self._days[(doctor_id, day)] = []
+            for appointment_id, start in rows:
+                self._add(appointment_id, doctor_id, day, _seconds(start))
+            self._loaded.add((doctor_id, day))
+
+    def conflicts(self, doctor_id, day, seconds):
+        low = max(0, seconds - CONFLICT_WINDOW)
+        high = min(DAY_SECONDS - 1, seconds + CONFLICT_WINDOW)
+        with self._lock:
+            slots = self._days.get((doctor_id, day), [])
+            i = bisect.bisect_left(slots, (low, -1))
+            return i < len(slots) and slots[i][0] <= high
+
+    def _booked_nearby(self, cursor, doctor_id, day, seconds, exclude_id=None):
+        # Locking read of the blocking appointments within the conflict window
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM appointments
+            WHERE doctor_id = %s
+            AND appointment_date = %s
+            AND appointment_time BETWEEN %s AND %s
+            AND status <> 'rejected'
+            AND id <> %s FOR UPDATE
+            """,
+            (doctor_id, day, _clock(max(0, seconds - CONFLICT_WINDOW)),
+             _clock(min(DAY_SECONDS - 1, seconds + CONFLICT_WINDOW)), exclude_id or 0)
+        )
+        return cursor.fetchone()[0] > 0
+
+    def book(self, conn, user_id, doctor_id, appointment_date, appointment_time):
+        # Atomic check-and-insert; returns the new appointment id or raises SlotConflict
+        doctor_id = int(doctor_id)
+        start = datetime.strptime(f"{appointment_date} {appointment_time}", "%Y-%m-%d %H:%M")
+        day = start.strftime('%Y-%m-%d')
+        seconds = start.hour * 3600 + start.minute * 60
+
+        if self._warmed_from is None:
+            self.warm(conn)
+
+        # Serialises bookings for one doctor inside this process
+        with self._doctor_lock(doctor_id):
+            self._ensure_day(conn, doctor_id, day)
+            if self.conflicts(doctor_id, day, seconds):
+                # Another process may have rejected that appointment; confirm before refusing
+                self._load_day(conn, doctor_id, day)
+                if self.conflicts(doctor_id, day, seconds):
+                    raise SlotConflict()
+
+            # End the transaction the reads above ran in. Under REPEATABLE READ their
+            # snapshot would otherwise hide bookings committed while we wait for the lock.
+            conn.commit()
+            cursor = conn.cursor()
+            try:
+                # Locking the doctor's row serialises bookings across processes; the
+                # conflict query then runs on the (doctor_id, appointment_date, appointment_time) index,
+                # as a locking read so it sees the latest committed rows, not a snapshot
+                cursor.execute("SELECT id FROM doctors WHERE id = %s FOR UPDATE", (doctor_id,))
+                if cursor.fetchone() is None:
+                    raise ValueError("Doctor not found")
+                if self._booked_nearby(cursor, doctor_id, day, seconds):
+                    conn.rollback()
+                    # Another process booked this slot; resync the day from the database
+                    self._load_day(conn, doctor_id, day)
+                    raise SlotConflict()
+
+                cursor.execute(
+                    "INSERT INTO appointments (user_id, doctor_id, appointment_date, appointment_time) VALUES (%s, %s, %s, %s)",
+                    (user_id, doctor_id, day, _clock(seconds))
+                )
+                appointment_id = cursor.lastrowid
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+            with self._lock:
+                self._add(appointment_id, doctor_id, day, seconds)
+            return appointment_id
+
+    def set_status(self, conn, appointment_id, status, doctor_id):
+        # Changes the status of one of doctor_id's appointments; returns False
+        # if there is no such appointment. A rejected appointment no longer
+        # blocks its slot, so taking the rejection back re-checks the slot the
+        # same way book() does and raises SlotConflict if it was booked since.
+        doctor_id = int(doctor_id)
+        with self._doctor_lock(doctor_id):
+            conn.commit()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT id FROM doctors WHERE id = %s FOR UPDATE", (doctor_id,))
+                cursor.fetchone()
+                cursor.execute(
+                    "SELECT doctor_id, appointment_date, appointment_time, status FROM appointments WHERE id = %s",
+                    (appointment_id,)
+                )
+                appointment = cursor.fetchone()
+                if appointment is None or int(appointment[0]) != doctor_id:
+                    conn.rollback()
+                    return False
+                day, seconds = _day(appointment[1]), _seconds(appointment[2])
+                if appointment[3] == 'rejected' and status != 'rejected':
+                    if self._booked_nearby(cursor, doctor_id, day, seconds, appointment_id):
+                        conn.rollback()
+                        self._load_day(conn, doctor_id, day)
+                        raise SlotConflict()
+                cursor.execute("UPDATE appointments SET status = %s WHERE id = %s", (status, appointment_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+            with self._lock:
+                self._remove(appointment_id)
+                if status != 'rejected' and self._is_loaded(doctor_id, day):
+                    self._add(appointment_id, doctor_id, day, seconds)
+            return True
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+# Inference backends FractureDetector can serve the model through. Anything
+# other than 'torch' is exported once from the .pt weights and reused until
+# the weights change; ultralytics' YOLO loads the exported file directly.
+BACKENDS = ('torch', 'onnx', 'openvino')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# Calibration images used per INT8 export
+CALIBRATION_LIMIT = 200
+
+
+def calibration_images(folder, limit=None):
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(folder)
+        for name in files
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def exported_path(model_path, backend, int8=False):
+    base = os.path.splitext(model_path)[0] + ('_int8' if int8 else '')
+    if backend == 'onnx':
+        return base + '.onnx'
+    if backend == 'openvino':
+        return base + '_openvino_model'
+    return model_path
+
+
+def _is_fresh(path, model_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(model_path)
+
+
+@contextmanager
+def _export_lock(target):
+    # Every inference worker starts at once; one exports, the others wait and
+    # then find the export fresh
+    with open(target + '.lock', 'a+') as f:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        yield
+
+
+def _install(exported, target):
+    # Moves a finished export into place; a stale OpenVINO directory is moved
+    # aside first, since os.replace cannot overwrite a non-empty directory
+    if os.path.isdir(target):
+        stale = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(target)), prefix='.stale-')
+        os.replace(target, os.path.join(stale, 'model'))
+        os.replace(exported, target)
+        shutil.rmtree(stale, ignore_errors=True)
+    else:
+        os.replace(exported, target)
+
+
+def letterbox(image, imgsz=640):
+    # Resize keeping the aspect ratio and pad to imgsz x imgsz, as ultralytics does before inference
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top = (imgsz - new_h) // 2
+    left = (imgsz - new_w) // 2
+    return cv2.copyMakeBorder(resized, top, imgsz - new_h - top, left, imgsz - new_w - left,
+                              cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+
+def _load_calibration_image(path, preprocess, imgsz):
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    image = letterbox(preprocess(image), imgsz)
+    return np.ascontiguousarray(image.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def quantize_onnx(fp32_path, int8_path, calibration_dir, preprocess, imgsz=640, limit=CALIBRATION_LIMIT):
+    # Static INT8 post-training quantization, calibrated on local X-rays that
+    # go through the same preprocessing as live requests
+    try:
+        import onnxruntime
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    except ImportError:
+        raise RuntimeError("ONNX INT8 quantization needs onnxruntime: pip install onnxruntime")
+
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    paths = calibration_images(calibration_dir, limit)
+    if not paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+
+    class FolderReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            for path in self._paths:
+                tensor = _load_calibration_image(path, preprocess, imgsz)
+                if tensor is not None:
+                    return {input_name: tensor}
+            return None
+
+    quantize_static(fp32_path, int8_path, FolderReader(),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True)
+    return int8_path
+
+
+def preprocess_calibration(calibration_dir, preprocess, out_dir, limit=CALIBRATION_LIMIT):
+    # Writes the calibration X-rays to out_dir as live requests reach the
+    # model, for exporters that read their calibration images from a folder
+    os.makedirs(out_dir, exist_ok=True)
+    written = 0
+    for i, path in enumerate(calibration_images(calibration_dir, limit)):
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        cv2.imwrite(os.path.join(out_dir, '%05d.png' % i), preprocess(image))
+        written += 1
+    if not written:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+    return out_dir
+
+
+def _calibration_yaml(calibration_dir, class_names, work):
+    # ultralytics calibrates OpenVINO INT8 exports from a dataset yaml
+    path = os.path.join(work, 'calibration.yaml')
+    with open(path, 'w') as f:
+        json.dump({
+            'path': os.path.abspath(calibration_dir),
+            'train': '.',
+            'val': '.',
+            'names': dict(enumerate(class_names))
+        }, f)
+    return path
+
+
+def export_model(model_path, backend='torch', int8=False, calibration_dir=None,
+                 preprocess=None, class_names=None, imgsz=640):
+    # Returns the path of the model file to load for backend, exporting it first if needed
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == 'torch':
+        return model_path
+    if int8 and not calibration_dir:
+        raise ValueError("INT8 quantization needs a calibration image folder")
+
+    target = exported_path(model_path, backend, int8)
+    if _is_fresh(target, model_path):
+        return target
+
+    with _export_lock(target):
+        # Another process may have finished the export while we waited
+        if _is_fresh(target, model_path):
+            return target
+        # Exports are written into a scratch directory next to the target and
+        # renamed into place, so a reader never sees a half-written model
+        work = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(target)), prefix='.export-')
+        try:
+            _export(model_path, backend, int8, calibration_dir, preprocess, class_names, imgsz, work)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+    return target
+
+
+def _export(model_path, backend, int8, calibration_dir, preprocess, class_names, imgsz, work):
+    from ultralytics import YOLO
+    # ultralytics writes exports next to the weights, so export from a copy in work
+    weights = os.path.join(work, os.path.basename(model_path))
+    shutil.copy2(model_path, weights)
+    target = exported_path(model_path, backend, int8)
+    if backend == 'onnx':
+        fp32_path = exported_path(model_path, 'onnx')
+        if not _is_fresh(fp32_path, model_path):
+            _install(YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True), fp32_path)
+        if int8:
+            _install(quantize_onnx(fp32_path, os.path.join(work, os.path.basename(target)),
+                                   calibration_dir, preprocess, imgsz), target)
+        return
+
+    data = None
+    if int8:
+        # Calibrate on the same CLAHE-enhanced inputs as the ONNX path, not the raw X-rays
+        if preprocess is not None:
+            calibration_dir = preprocess_calibration(calibration_dir, preprocess, os.path.join(work, 'calibration'))
+        data = _calibration_yaml(calibration_dir, class_names, work)
+    exported = YOLO(weights).export(format='openvino', imgsz=imgsz, dynamic=True, int8=int8, data=data)
+    _install(exported, target)
+
+
+def _box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(baseline, candidate, iou_threshold=0.5):
+    # baseline/candidate: per-image lists of (x1, y1, x2, y2, conf, class_name).
+    # Greedily matches candidate boxes to baseline boxes of the same class.
+    matched = 0
+    baseline_total = 0
+    candidate_total = 0
+    ious = []
+    conf_deltas = []
+    for expected, actual in zip(baseline, candidate):
+        baseline_total += len(expected)
+        candidate_total += len(actual)
+        unused = list(actual)
+        for box in sorted(expected, key=lambda d: d[4], reverse=True):
+            best, best_iou = None, iou_threshold
+            for other in unused:
+                if other[5] == box[5]:
+                    iou = _box_iou(box, other)
+                    if iou >= best_iou:
+                        best, best_iou = other, iou
+            if best is not None:
+                unused.remove(best)
+                matched += 1
+                ious.append(best_iou)
+                conf_deltas.append(abs(best[4] - box[4]))
+    return {
+        'images': len(baseline),
+        'baseline_detections': baseline_total,
+        'candidate_detections': candidate_total,
+        'matched': matched,
+        'recall': matched / baseline_total if baseline_total else 1.0,
+        'precision': matched / candidate_total if candidate_total else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else None,
+        'max_conf_delta': float(np.max(conf_deltas)) if conf_deltas else None
+    }
+
+
+def check_accuracy(candidate, images, iou_threshold=0.5):
+    # Runs the PyTorch baseline and the candidate detector over the same images
+    from predict import FractureDetector
+    baseline = FractureDetector(use_cache=False, backend='torch')
+    return compare_detections(baseline.detect_raw(images), candidate.detect_raw(images), iou_threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the fracture model to a CPU inference backend and check its accuracy")
+    parser.add_argument('--backend', choices=BACKENDS[1:], required=True)
+    parser.add_argument('--int8', action='store_true', help="apply INT8 post-training quantization")
+    parser.add_argument('--calibration-dir', help="folder of X-rays used to calibrate INT8 quantization")
+    parser.add_argument('--check-dir', help="folder of X-rays to compare against the PyTorch baseline")
+    parser.add_argument('--iou', type=float, default=0.5, help="IoU needed to count a box as matching the baseline")
+    args = parser.parse_args()
+
+    from predict import FractureDetector
+    detector = FractureDetector(use_cache=False, backend=args.backend, int8=args.int8,
+                                calibration_dir=args.calibration_dir)
+    print(f"Serving model from {detector.model_path}")
+    if args.check_dir:
+        report = check_accuracy(detector, calibration_images(args.check_dir), args.iou)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
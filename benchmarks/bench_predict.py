@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import parse_resolutions, synthetic_xray_png
+
+# Benchmarks the predict.py pipeline on synthetic X-rays, entirely offline.
+# Without bonefracture_yolov8.pt (or with --stand-in) an untrained yolov8n
+# built from its yaml stands in for the real model, which is enough to time
+# every stage at the real input sizes.
+#
+#   python benchmarks/bench_predict.py --resolutions 1024x1024,3000x2500 --modes single,batched
+#   python benchmarks/bench_predict.py --resolutions 3000x2500 --modes single,tiled --tile-size 640
+#   python benchmarks/bench_predict.py --baseline benchmarks/results/predict-20250101-120000.json
+
+
+def make_detector():
+    # Top-level so spawned pool workers can build the same detector
+    import predict
+    from views import ViewStore
+    view_dir = os.environ.get('BENCH_VIEW_DIR') or tempfile.mkdtemp(prefix='bench-views-')
+    predict.view_store = ViewStore(root=os.path.join(view_dir, 'processed'),
+                                   source_root=os.path.join(view_dir, 'uploads'),
+                                   persist_sources=False)
+    model = None
+    if os.environ.get('BENCH_STAND_IN') == '1' or not os.path.exists(os.path.join(ROOT, predict.MODEL_PATH)):
+        from ultralytics import YOLO
+        model = YOLO('yolov8n.yaml')
+    return predict.FractureDetector(use_cache=False, model=model)
+
+
+def summarize(latencies, images, errors=0):
+    ms = np.array(latencies) * 1000
+    total = float(np.sum(latencies))
+    return {
+        'runs': len(latencies),
+        'images': images,
+        'errors': errors,
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(np.mean(ms)), 3),
+        'images_per_sec': round(images / total, 3) if total else None
+    }
+
+
+def count_errors(outputs):
+    return sum(1 for output in outputs if output[0] is None)
+
+
+def bench_single(detector, images, warmup):
+    for image in images[:warmup]:
+        detector.detect_batch([image])
+    latencies = []
+    errors = 0
+    for image in images:
+        start = time.perf_counter()
+        errors += count_errors(detector.detect_batch([image]))
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, len(images), errors)
+
+
+def bench_batched(detect_batch, images, batch_size, warmup, clients=1):
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    for batch in batches[:warmup]:
+        detect_batch(batch)
+
+    def run(batch):
+        start = time.perf_counter()
+        errors = count_errors(detect_batch(batch))
+        return time.perf_counter() - start, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        timings = list(executor.map(run, batches))
+    wall = time.perf_counter() - start
+
+    result = summarize([t for t, _ in timings], len(images), sum(e for _, e in timings))
+    # With several clients in flight, throughput is measured on the wall clock
+    result['images_per_sec'] = round(len(images) / wall, 3)
+    result['batch_size'] = batch_size
+    result['clients'] = clients
+    return result
+
+
+def bench_stages(detector, images, warmup):
+    # Times each stage of detect_batch separately for one image at a time
+    import predict
+    stages = {'read_decode': [], 'preprocess': [], 'inference': [], 'postprocess': [], 'register_views': []}
+    for n, image in enumerate(images[:warmup] + images):
+        t0 = time.perf_counter()
+        data, _ = detector._read(image)
+        original_img = detector._decode(data)
+        t1 = time.perf_counter()
+        enhanced = detector._prepare(original_img)
+        t2 = time.perf_counter()
+        results = detector.model([enhanced], conf=detector.conf, iou=detector.iou, verbose=False)
+        t3 = time.perf_counter()
+        detections = detector._extract(original_img, detector._rows(results))
+        t4 = time.perf_counter()
+        predict.view_store.register('bench%d' % n, detections, image=original_img)
+        t5 = time.perf_counter()
+        if n >= warmup:
+            for name, elapsed in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                stages[name].append(elapsed)
+    return {name: summarize(latencies, len(latencies)) for name, latencies in stages.items()}
+
+
+def compare(results, baseline, tolerance):
+    # Flags every mode/resolution whose p50 got slower than baseline by more than tolerance
+    regressions = []
+    for resolution, modes in results['results'].items():
+        for mode, current in modes.items():
+            previous = baseline.get('results', {}).get(resolution, {}).get(mode)
+            if not previous or 'p50_ms' not in current or 'p50_ms' not in previous:
+                continue
+            ratio = current['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else 1.0
+            print(f"{resolution:>10} {mode:<13} p50 {previous['p50_ms']:9.2f} -> {current['p50_ms']:9.2f} ms ({ratio:.2f}x)")
+            if ratio > 1 + tolerance:
+                regressions.append((resolution, mode, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fracture detection pipeline on synthetic X-rays")
+    parser.add_argument('--resolutions', default='512x512,1024x1024,2048x1680,3000x2500',
+                        help="comma separated WIDTHxHEIGHT list")
+    parser.add_argument('--images', type=int, default=20, help="images per resolution")
+    parser.add_argument('--modes', default='stages,single,batched,multiprocess')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--tile-size', type=int, default=640, help="tile size for the tiled mode")
+    parser.add_argument('--workers', type=int, default=2, help="processes for the multiprocess mode")
+    parser.add_argument('--threads', type=int, default=1, help="intra-op threads per worker process")
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--stand-in', action='store_true', help="use the untrained stand-in model even if weights exist")
+    parser.add_argument('--output', help="where to write the JSON report")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    os.environ['BENCH_VIEW_DIR'] = tempfile.mkdtemp(prefix='bench-views-')
+    if args.stand_in:
+        os.environ['BENCH_STAND_IN'] = '1'
+    modes = args.modes.split(',')
+
+    import predict
+    detector = make_detector()
+    pool = None
+    if 'multiprocess' in modes:
+        from inference_pool import InferencePool
+        pool = InferencePool(args.workers, args.threads, factory=make_detector)
+        pool.wait_ready()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'model': 'stand-in' if args.stand_in or not os.path.exists(predict.MODEL_PATH) else predict.MODEL_PATH,
+        'config': vars(args),
+        'results': {}
+    }
+
+    try:
+        for width, height in parse_resolutions(args.resolutions):
+            resolution = f'{width}x{height}'
+            images = [synthetic_xray_png(width, height, seed) for seed in range(args.images)]
+            results = report['results'][resolution] = {}
+            if 'stages' in modes:
+                results['stages'] = bench_stages(detector, images, args.warmup)
+            if 'single' in modes:
+                results['single'] = bench_single(detector, images, args.warmup)
+            if 'tiled' in modes:
+                tile_size, detector.tile_size = detector.tile_size, args.tile_size
+                results['tiled'] = bench_single(detector, images, args.warmup)
+                detector.tile_size = tile_size
+            if 'batched' in modes:
+                results['batched'] = bench_batched(detector.detect_batch, images, args.batch_size, args.warmup)
+            if pool is not None:
+                results['multiprocess'] = bench_batched(pool.detect_batch, images, args.batch_size,
+                                                        args.warmup, clients=args.workers)
+                results['multiprocess']['workers'] = args.workers
+            print(resolution, json.dumps({mode: r for mode, r in results.items() if mode != 'stages'}, indent=2))
+    finally:
+        if pool is not None:
+            pool.close()
+
+    output = args.output or os.path.join('benchmarks', 'results',
+                                         'predict-%s.json' % datetime.now().strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark report to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Measures how quickly a fresh web worker can serve its first page: the time to
+# import app.py, the time to render / and /login once, and the resident memory
+# afterwards. Each run is a new interpreter, so nothing is shared between runs.
+# The inference stack (torch, ultralytics) and the Mistral SDK must stay out of
+# the web tier; the run fails if importing app.py loads any of them.
+#
+#   python benchmarks/bench_startup.py --runs 10
+#   python benchmarks/bench_startup.py --baseline benchmarks/results/startup-20250101-120000.json
+
+HEAVY_MODULES = ('torch', 'ultralytics', 'mistralai', 'onnxruntime', 'openvino')
+
+PROBE = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+statuses = [client.get(path).status_code for path in ('/', '/login')]
+served = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'first_request_s': served - imported,
+    'statuses': statuses,
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+    'heavy_modules': sorted(name for name in %r if name in sys.modules)
+}))
+'''
+
+
+def probe(env):
+    output = subprocess.run([sys.executable, '-c', PROBE % (HEAVY_MODULES,)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values):
+    ms = np.array(values) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'max_ms': round(float(np.max(ms)), 3)
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Flags every measurement whose p50 got slower than baseline by more than tolerance
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or 'p50_ms' not in current or 'p50_ms' not in previous:
+            continue
+        ratio = current['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else 1.0
+        print(f"{name:<15} p50 {previous['p50_ms']:9.2f} -> {current['p50_ms']:9.2f} ms ({ratio:.2f}x)")
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the web tier")
+    parser.add_argument('--runs', type=int, default=10, help="fresh interpreters to start")
+    parser.add_argument('--max-rss-mb', type=float, help="fail if a worker's resident memory exceeds this")
+    parser.add_argument('--output', help="where to write the JSON report")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    # A throwaway SQLite file keeps the probe away from MySQL; nothing connects
+    # to it before the first query anyway
+    env = dict(os.environ, SQLITE_DATABASE=os.path.join(tempfile.mkdtemp(prefix='bench-startup-'), 'app.db'),
+               INFERENCE_WORKERS='0')
+    # The first run also compiles bytecode; it is not counted
+    probe(env)
+    runs = [probe(env) for _ in range(args.runs)]
+
+    rss = [run['max_rss_mb'] for run in runs]
+    heavy = sorted(set(name for run in runs for name in run['heavy_modules']))
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'results': {
+            'import': summarize([run['import_s'] for run in runs]),
+            'first_request': summarize([run['first_request_s'] for run in runs]),
+            'total': summarize([run['import_s'] + run['first_request_s'] for run in runs])
+        },
+        'max_rss_mb': round(max(rss), 1),
+        'statuses': runs[-1]['statuses'],
+        'heavy_modules': heavy
+    }
+    print(json.dumps(report['results'], indent=2))
+    print(f"max RSS {report['max_rss_mb']} MB, heavy modules loaded: {heavy or 'none'}")
+
+    output = args.output or os.path.join('benchmarks', 'results',
+                                         'startup-%s.json' % datetime.now().strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark report to {output}")
+
+    failed = False
+    if heavy:
+        print(f"app.py imported {', '.join(heavy)}; these belong behind predict/chat lazy imports")
+        failed = True
+    if args.max_rss_mb and report['max_rss_mb'] > args.max_rss_mb:
+        print(f"Resident memory {report['max_rss_mb']} MB is above the {args.max_rss_mb} MB budget")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stand_ins import PASSWORD, StubChatServer, doctor_email, patient_email, random_slot, seed_database
+from synthetic import synthetic_xray_png
+
+# End-to-end load test of the web app on one machine. The app runs in a
+# child process against local stand-ins: a SQLite database seeded from
+# bonefracture.sql, a stub Mistral server behind /chatbot and, unless
+# --detector real, a fake model with a fixed cost behind /enquiry uploads.
+# Virtual patients and doctors log in and replay a weighted mix of page
+# views, bookings, uploads, status changes and chat messages, fetching the
+# result images after every upload like a browser, and the report gives
+# throughput, latency percentiles and error rates for every route.
+#
+#   python benchmarks/load_test.py --users 50 --duration 60
+#   python benchmarks/load_test.py --mix doctors=4,book_appointment=1,enquiry=2,chatbot=1 --think-ms 500
+#   python benchmarks/load_test.py --baseline benchmarks/results/load-20250101-120000.json
+
+# Weighted actions per role; logins happen at the start of every session
+DEFAULT_MIX = 'doctors=5,book_appointment=2,enquiry=2,chatbot=2,doctor_appointments=1,update_appointment_status=1'
+PATIENT_ROUTES = ('doctors', 'book_appointment', 'enquiry', 'chatbot')
+DOCTOR_ROUTES = ('doctor_appointments', 'update_appointment_status', 'chatbot')
+
+# Result images on the enquiry page, shown right away (src) or on click
+# (data-src), and the accept/reject forms on the doctor's appointment list
+VIEW_URL = re.compile(r'(?:data-)?src="(/processed/[^"]+)"')
+STATUS_URL = re.compile(r'action="/update_appointment_status/(\d+)"')
+
+QUESTIONS = [
+    "How long does a wrist fracture take to heal?",
+    "What is the difference between a sprain and a fracture?",
+    "Should I use ice or heat on a broken finger?",
+    "How much calcium do I need for strong bones?",
+    "What are the signs of osteoporosis?",
+    "Can a hairline fracture heal without a cast?",
+    "When can I start physiotherapy after a humerus fracture?",
+    "Why does my elbow still hurt after the cast came off?",
+]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if name not in PATIENT_ROUTES + DOCTOR_ROUTES:
+            raise ValueError(f"Unknown route in --mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(args):
+    # Child process: the app on a threaded werkzeug server, with uploads and
+    # rendered views in a scratch directory and optionally the fake model
+    import logging
+    from werkzeug.serving import make_server
+    import app
+    import predict
+    from views import ViewStore
+    from stand_ins import FakeModel
+
+    # Checkouts with the templates next to app.py instead of in templates/
+    if not os.path.isdir(os.path.join(ROOT, app.app.template_folder)):
+        app.app.template_folder = ROOT
+    view_dir = tempfile.mkdtemp(prefix='load-views-')
+    predict.view_store = ViewStore(root=os.path.join(view_dir, 'processed'),
+                                   source_root=os.path.join(view_dir, 'uploads'))
+    if args.detector == 'fake':
+        # No result cache, every upload pays for the full pipeline
+        predict.detector = predict.FractureDetector(use_cache=False, model=FakeModel(args.model_ms, args.model_image_ms))
+    else:
+        predict.detector = predict.FractureDetector(use_cache=False)
+    predict.detector.warm_up()
+    # Errors only; a line per request would cost more than some of the routes
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', args.port, app.app, threaded=True).serve_forever()
+
+
+def start_server(args, database, chat_url):
+    port = free_port()
+    env = dict(os.environ, SQLITE_DATABASE=database, MISTRAL_SERVER_URL=chat_url, MISTRAL_API_KEY='load-test',
+               INFERENCE_WORKERS='0')
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port),
+               '--detector', args.detector, '--model-ms', str(args.model_ms), '--model-image-ms', str(args.model_image_ms)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App server exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return process, 'http://127.0.0.1:%d' % port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"App server did not answer within {args.startup_timeout}s")
+
+
+class Client:
+    # One browser: a keep-alive connection, the session cookie and the
+    # ETags of pages already seen. Redirects are returned, not followed.
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+        self.cookies = {}
+        self.etags = {}
+
+    def reset(self):
+        self.cookies.clear()
+        self.etags.clear()
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join('%s=%s' % item for item in self.cookies.items())
+        if method == 'GET' and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                if morsel.value:
+                    self.cookies[name] = morsel.value
+                else:
+                    self.cookies.pop(name, None)
+        if response.headers.get('ETag'):
+            self.etags[path] = response.headers['ETag']
+        return response.status, response.headers, data
+
+
+class Stats:
+    # Per-route latencies and outcomes, recorded only after the warm-up
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recording = False
+        self.started = self.stopped = None
+        self.latencies = {}
+        self.errors = Counter()
+        self.statuses = {}
+        self.samples = {}
+
+    def start(self):
+        with self.lock:
+            self.recording = True
+            self.started = time.perf_counter()
+
+    def stop(self):
+        with self.lock:
+            self.recording = False
+            self.stopped = time.perf_counter()
+
+    def record(self, route, seconds, status, error=None):
+        with self.lock:
+            if not self.recording:
+                return
+            self.latencies.setdefault(route, []).append(seconds)
+            self.statuses.setdefault(route, Counter())[str(status)] += 1
+            if error:
+                self.errors[route] += 1
+                samples = self.samples.setdefault(route, [])
+                if len(samples) < 5:
+                    samples.append(error)
+
+    def summary(self):
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        results = {}
+        everything = []
+        for route, latencies in sorted(self.latencies.items()):
+            everything.extend(latencies)
+            results[route] = dict(summarize(latencies, self.errors[route], elapsed),
+                                  statuses=dict(self.statuses[route]))
+            if route in self.samples:
+                results[route]['error_samples'] = self.samples[route]
+        if everything:
+            results['all'] = summarize(everything, sum(self.errors.values()), elapsed)
+        return results
+
+
+def summarize(latencies, errors, elapsed):
+    ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': round(errors / len(latencies), 4),
+        'requests_per_sec': round(len(latencies) / elapsed, 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(np.max(ms)), 3),
+        'mean_ms': round(float(np.mean(ms)), 3)
+    }
+
+
+def multipart(field, filename, content, content_type):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, 'multipart/form-data; boundary=%s' % boundary
+
+
+def redirects_to(headers, endpoint):
+    return urlsplit(headers.get('Location', '')).path.rstrip('/') == '/' + endpoint
+
+
+class VirtualUser:
+    # Logs in, runs session_length weighted actions with exponential think
+    # times between them, then starts a new browser session
+    def __init__(self, index, doctor, args, url, mix, doctor_ids, uploads, stats):
+        self.doctor = doctor
+        self.args = args
+        self.mix = [(route, weight) for route, weight in mix.items()
+                    if route in (DOCTOR_ROUTES if doctor else PATIENT_ROUTES) and weight > 0]
+        self.doctor_ids = doctor_ids
+        self.uploads = uploads
+        self.stats = stats
+        self.rng = random.Random(args.seed * 100003 + index)
+        self.client = Client(url, args.request_timeout)
+        count = args.doctors if doctor else args.patients
+        self.email = (doctor_email if doctor else patient_email)(self.rng.randrange(count))
+        self.pending_ids = []
+        self.seen_ids = set()
+
+    def call(self, route, method, path, check, body=None, headers=None):
+        start = time.perf_counter()
+        try:
+            status, response_headers, data = self.client.request(method, path, body, headers)
+        except Exception as e:
+            self.stats.record(route, time.perf_counter() - start, 'exception', f"{type(e).__name__}: {str(e)}")
+            return None
+        error = check(status, response_headers, data)
+        self.stats.record(route, time.perf_counter() - start, status, error)
+        return status, response_headers, data
+
+    def login(self):
+        self.client.reset()
+        route = 'doctor_login' if self.doctor else 'login'
+        landing = 'doctor_appointments' if self.doctor else 'enquiry'
+        body = urlencode({'email': self.email, 'password': PASSWORD})
+        self.call(route, 'POST', '/' + route,
+                  lambda status, headers, data: None if status == 302 and redirects_to(headers, landing)
+                  else f"login failed with status {status}",
+                  body, {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def page(self, route, path):
+        def check(status, headers, data):
+            if status in (200, 304):
+                return None
+            if status == 302:
+                return f"redirected to {headers.get('Location')}"
+            return f"status {status}"
+        return self.call(route, 'GET', path, check)
+
+    def book_appointment(self):
+        appointment_date, appointment_time = random_slot(self.rng)
+        body = urlencode({'doctor_id': self.rng.choice(self.doctor_ids), 'appointment_date': appointment_date,
+                          'appointment_time': appointment_time})
+        response = self.call('book_appointment', 'POST', '/book_appointment',
+                             lambda status, headers, data: None if status == 302 and redirects_to(headers, 'doctors')
+                             else f"status {status} to {headers.get('Location')}",
+                             body, {'Content-Type': 'application/x-www-form-urlencoded'})
+        # The browser follows the redirect and shows the flash message
+        if response is not None and response[0] == 302:
+            self.page('doctors', '/doctors')
+
+    def enquiry(self):
+        def check(status, headers, data):
+            if status == 200 and b'/processed/' in data:
+                return None
+            return f"status {status} without results"
+        body, content_type = multipart('file', 'xray.png', self.rng.choice(self.uploads), 'image/png')
+        response = self.call('enquiry', 'POST', '/enquiry', check, body, {'Content-Type': content_type})
+        if response is None or response[0] != 200:
+            return
+        # The browser then loads the result views, which are rendered and
+        # encoded on first request
+        def view_check(status, headers, data):
+            if status == 304 or (status == 200 and headers.get('Content-Type', '').startswith('image/')):
+                return None
+            return f"status {status} ({headers.get('Content-Type')})"
+        for path in dict.fromkeys(VIEW_URL.findall(response[2].decode('utf-8', 'replace'))):
+            self.call('processed_view', 'GET', path, view_check)
+
+    def doctor_appointments(self):
+        response = self.page('doctor_appointments', '/doctor_appointments')
+        # Remember which appointments are waiting for an answer; a 304 keeps
+        # the list from the last full page
+        if response is not None and response[0] == 200:
+            self.pending_ids = STATUS_URL.findall(response[2].decode('utf-8', 'replace'))
+            self.seen_ids.update(self.pending_ids)
+
+    def update_appointment_status(self):
+        if not self.pending_ids:
+            self.doctor_appointments()
+        # Once everything on the page is answered the doctor changes their
+        # mind about an earlier one, so the action keeps running all test long
+        candidates = self.pending_ids or sorted(self.seen_ids)
+        if not candidates:
+            return
+        appointment_id = self.rng.choice(candidates)
+        body = urlencode({'status': 'rejected' if self.rng.random() < 0.2 else 'accepted'})
+        response = self.call('update_appointment_status', 'POST', '/update_appointment_status/' + appointment_id,
+                             lambda status, headers, data: None if status == 302 and redirects_to(headers, 'doctor_appointments')
+                             else f"status {status} to {headers.get('Location')}",
+                             body, {'Content-Type': 'application/x-www-form-urlencoded'})
+        # The redirect shows the list with the new status
+        if response is not None and response[0] == 302:
+            self.doctor_appointments()
+
+    def chatbot(self):
+        stream = self.rng.random() < self.args.chat_stream_share
+        def check(status, headers, data):
+            if status != 200:
+                return f"status {status}"
+            if stream:
+                return None if b'event: done' in data else "stream ended without a done event"
+            return None if 'response' in json.loads(data) else "no response in reply"
+        body = json.dumps({'message': self.rng.choice(QUESTIONS)})
+        self.call('chatbot', 'POST', '/chatbot?stream=1' if stream else '/chatbot', check, body,
+                  {'Content-Type': 'application/json'})
+
+    def act(self, route):
+        if route == 'doctors':
+            self.page('doctors', '/doctors')
+        elif route == 'doctor_appointments':
+            self.doctor_appointments()
+        elif route == 'update_appointment_status':
+            self.update_appointment_status()
+        elif route == 'book_appointment':
+            self.book_appointment()
+        elif route == 'enquiry':
+            self.enquiry()
+        elif route == 'chatbot':
+            self.chatbot()
+
+    def run(self, deadline):
+        routes = [route for route, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        if not routes:
+            return
+        actions = 0
+        while time.perf_counter() < deadline:
+            if actions % self.args.session_length == 0:
+                self.login()
+            else:
+                self.act(self.rng.choices(routes, weights)[0])
+            actions += 1
+            if self.args.think_ms:
+                time.sleep(min(self.rng.expovariate(1000 / self.args.think_ms), max(0, deadline - time.perf_counter())))
+
+
+def compare(results, baseline, tolerance):
+    # Flags routes whose p95 slowed down by more than tolerance, or whose
+    # error rate rose by more than a percentage point
+    regressions = []
+    for route, current in results['results'].items():
+        previous = baseline.get('results', {}).get(route)
+        if not previous:
+            continue
+        ratio = current['p95_ms'] / previous['p95_ms'] if previous['p95_ms'] else 1.0
+        print(f"{route:<25} p95 {previous['p95_ms']:9.2f} -> {current['p95_ms']:9.2f} ms ({ratio:.2f}x), "
+              f"errors {previous['error_rate']:.2%} -> {current['error_rate']:.2%}")
+        if ratio > 1 + tolerance:
+            regressions.append((route, 'p95', ratio))
+        if current['error_rate'] > previous['error_rate'] + 0.01:
+            regressions.append((route, 'error_rate', current['error_rate']))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'route':<25} {'requests':>8} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for route, r in results.items():
+        print(f"{route:<25} {r['requests']:>8} {r['requests_per_sec']:>8.1f} {r['error_rate']:>7.2%} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the web app end to end against local stand-ins")
+    parser.add_argument('--users', type=int, default=20, help="concurrent virtual users")
+    parser.add_argument('--doctor-share', type=float, default=0.2, help="fraction of virtual users who are doctors")
+    parser.add_argument('--duration', type=float, default=60, help="seconds of measured traffic")
+    parser.add_argument('--warmup', type=float, default=5, help="seconds of traffic before measuring")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="relative weights of the actions, route=weight,...")
+    parser.add_argument('--session-length', type=int, default=20, help="actions before a user logs in again")
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a user's actions")
+    parser.add_argument('--chat-stream-share', type=float, default=0.5, help="fraction of chat messages sent with ?stream=1")
+    parser.add_argument('--patients', type=int, default=500, help="patient accounts to seed")
+    parser.add_argument('--doctors', type=int, default=50, help="doctor accounts to seed")
+    parser.add_argument('--appointments-per-doctor', type=int, default=20, help="appointments to seed per doctor")
+    parser.add_argument('--upload-sizes', default='1024x1024,2048x1680', help="resolutions of the uploaded X-rays")
+    parser.add_argument('--upload-variants', type=int, default=8, help="distinct synthetic X-rays per resolution")
+    parser.add_argument('--detector', choices=('fake', 'real'), default='fake', help="model behind /enquiry uploads")
+    parser.add_argument('--model-ms', type=float, default=30, help="fake model time per call")
+    parser.add_argument('--model-image-ms', type=float, default=10, help="fake model time per image in a call")
+    parser.add_argument('--chat-latency-ms', type=float, default=300, help="stub chat server time to first token")
+    parser.add_argument('--chat-chunk-ms', type=float, default=20, help="stub chat server time between streamed chunks")
+    parser.add_argument('--chat-port', type=int, default=0, help="port for the stub chat server (default: any free port)")
+    parser.add_argument('--url', help="load test an app that is already running here instead of starting one; "
+                                      "it must use --database and MISTRAL_SERVER_URL from this run's output")
+    parser.add_argument('--database', help="SQLite file to seed (default: a temporary file)")
+    parser.add_argument('--request-timeout', type=float, default=120, help="seconds before a request is abandoned")
+    parser.add_argument('--startup-timeout', type=float, default=120, help="seconds to wait for the app to answer")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="where to write the JSON report")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p95 slowdown against the baseline")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if args.serve:
+        serve(args)
+        return
+
+    mix = parse_mix(args.mix)
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='load-test-'), 'app.db')
+    doctor_ids = seed_database(database, args.patients, args.doctors, args.appointments_per_doctor, args.seed)
+    uploads = [synthetic_xray_png(width, height, seed=args.seed + i)
+               for width, height in (tuple(int(n) for n in size.lower().split('x')) for size in args.upload_sizes.split(','))
+               for i in range(args.upload_variants)]
+    chat = StubChatServer(args.chat_latency_ms, args.chat_chunk_ms, port=args.chat_port).start()
+    print(f"Seeded {database}; stub chat server at {chat.url}", file=sys.stderr)
+
+    process = None
+    url = args.url
+    if not url:
+        process, url = start_server(args, database, chat.url)
+    stats = Stats()
+    try:
+        doctors = int(round(args.users * args.doctor_share))
+        users = [VirtualUser(i, i < doctors, args, url, mix, doctor_ids, uploads, stats) for i in range(args.users)]
+        deadline = time.perf_counter() + args.warmup + args.duration
+        threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in users]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        stats.start()
+        for thread in threads:
+            thread.join()
+        stats.stop()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        chat.stop()
+
+    results = stats.summary()
+    print_table(results)
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'results': results,
+        'chat_upstream_calls': chat.calls
+    }
+    output = args.output or os.path.join('benchmarks', 'results',
+                                         'load-%s.json' % datetime.now().strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved load test report to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond the baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Local stand-ins for the services the web app talks to, so that it can be
+# load tested on one machine: a SQLite copy of bonefracture.sql with synthetic
+# accounts, a Mistral-compatible chat server and a model with a fixed cost.
+
+PASSWORD = 'loadtest'
+
+
+def patient_email(i):
+    return 'patient%d@loadtest.local' % i
+
+
+def doctor_email(i):
+    return 'doctor%d@loadtest.local' % i
+
+
+def random_slot(rng, days=365):
+    # A date in the next year and a quarter-hour between 08:00 and 17:45
+    day = date.today() + timedelta(days=rng.randrange(1, days))
+    return day.isoformat(), '%02d:%02d:00' % (rng.randrange(8, 18), rng.choice((0, 15, 30, 45)))
+
+
+def seed_database(path, patients, doctors, appointments_per_doctor=20, seed=0):
+    # Loads the dump into a fresh SQLite file and adds patients and doctors
+    # that all log in with PASSWORD, plus a calendar of booked appointments.
+    # Returns the database ids of the doctors.
+    from db import load_mysql_dump, sqlite_factory
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite_factory(path)()
+    try:
+        load_mysql_dump(conn, os.path.join(root, 'bonefracture.sql'))
+    finally:
+        conn.close()
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executemany("INSERT INTO users (uid, name, email, password, phone) VALUES (?, ?, ?, ?, ?)",
+                         [('uid_load%d' % i, 'Patient %d' % i, patient_email(i), PASSWORD, '555%07d' % i)
+                          for i in range(patients)])
+        conn.executemany("INSERT INTO doctors (uid, name, email, password, phone, specialization) VALUES (?, ?, ?, ?, ?, ?)",
+                         [('doc_uid_load%d' % i, 'Doctor %d' % i, doctor_email(i), PASSWORD, '556%07d' % i,
+                           rng.choice(('Orthopedics', 'Radiology', 'Sports Medicine', 'Trauma Surgery')))
+                          for i in range(doctors)])
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE email LIKE '%@loadtest.local'")]
+        doctor_ids = [row[0] for row in conn.execute("SELECT id FROM doctors WHERE email LIKE '%@loadtest.local' ORDER BY id")]
+        appointments = set()
+        for doctor_id in doctor_ids:
+            for _ in range(appointments_per_doctor):
+                appointments.add((rng.choice(user_ids), doctor_id) + random_slot(rng))
+        conn.executemany("INSERT INTO appointments (user_id, doctor_id, appointment_date, appointment_time) VALUES (?, ?, ?, ?)",
+                         sorted(appointments))
+        conn.commit()
+    finally:
+        conn.close()
+    return doctor_ids
+
+
+class FakeModel:
+    # Takes the place of the YOLO model: waits call_ms per call plus image_ms
+    # per image, like a batched forward pass, and reports one wrist fracture
+    # in the middle of every image. Everything around the model (decode,
+    # CLAHE, rendering the views) still runs for real.
+    def __init__(self, call_ms=30.0, image_ms=10.0):
+        self.call_ms = call_ms
+        self.image_ms = image_ms
+
+    def __call__(self, images, conf=0.25, iou=0.45, verbose=True):
+        if not isinstance(images, list):
+            images = [images]
+        time.sleep((self.call_ms + self.image_ms * len(images)) / 1000)
+        return [FakeResult(image.shape[1], image.shape[0]) for image in images]
+
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeBoxes:
+    def __init__(self, rows):
+        self.data = FakeTensor(rows)
+
+
+class FakeResult:
+    # Same shape as an ultralytics result as far as FractureDetector._rows goes
+    def __init__(self, width, height):
+        box = [width * 0.4, height * 0.4, width * 0.6, height * 0.6, 0.8, 6]
+        self.boxes = FakeBoxes(np.array([box], dtype=np.float32))
+
+
+ANSWER = ("Most simple fractures heal in six to eight weeks. Keep the limb immobilised as advised, "
+          "eat enough calcium and vitamin D, avoid smoking and follow up with an orthopedic doctor "
+          "if the pain, swelling or numbness gets worse.")
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    # Answers POST /v1/chat/completions like the Mistral API, as a single
+    # JSON completion or, with "stream": true, as server-sent chunks
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        server = self.server
+        with server.lock:
+            server.calls += 1
+        model = body.get('model', 'stub')
+        created = int(time.time())
+        time.sleep(server.latency_ms / 1000)
+
+        if not body.get('stream'):
+            payload = json.dumps({
+                'id': 'stub-%d' % server.calls, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ANSWER}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 40, 'completion_tokens': 50, 'total_tokens': 90}
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        words = ANSWER.split(' ')
+        for i in range(0, len(words), server.words_per_chunk):
+            text = ' '.join(words[i:i + server.words_per_chunk]) + (' ' if i + server.words_per_chunk < len(words) else '')
+            chunk = {'id': 'stub-%d' % server.calls, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                     'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': text}, 'finish_reason': None}]}
+            self.wfile.write(b'data: ' + json.dumps(chunk).encode() + b'\n\n')
+            self.wfile.flush()
+            time.sleep(server.chunk_ms / 1000)
+        done = {'id': 'stub-%d' % server.calls, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': {'content': ''}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 40, 'completion_tokens': 50, 'total_tokens': 90}}
+        self.wfile.write(b'data: ' + json.dumps(done).encode() + b'\n\ndata: [DONE]\n\n')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubChatServer:
+    # Runs ChatHandler on a background thread; point MISTRAL_SERVER_URL at url
+    def __init__(self, latency_ms=300.0, chunk_ms=20.0, words_per_chunk=4, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), ChatHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency_ms = latency_ms
+        self.httpd.chunk_ms = chunk_ms
+        self.httpd.words_per_chunk = words_per_chunk
+        self.httpd.calls = 0
+        self.httpd.lock = threading.Lock()
+        self.url = 'http://%s:%d' % self.httpd.server_address[:2]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='stub-chat', daemon=True)
+
+    @property
+    def calls(self):
+        return self.httpd.calls
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+
+
+def parse_resolutions(text):
+    # "512x512,2048x1680" -> [(512, 512), (2048, 1680)] as (width, height)
+    resolutions = []
+    for part in text.split(','):
+        width, height = part.lower().split('x')
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+def synthetic_xray(width, height, seed=0):
+    # A grayscale radiograph look-alike: dark background, a soft-tissue blob,
+    # a few bright long bones (one with a dark fracture line) and sensor noise.
+    # Returned as a 3-channel BGR image, like cv2.imread gives for an upload.
+    rng = np.random.default_rng(seed)
+    gray = np.full((height, width), 18, dtype=np.uint8)
+    scale = min(width, height)
+
+    center = (width // 2, height // 2)
+    axes = (int(width * 0.35), int(height * 0.45))
+    cv2.ellipse(gray, center, axes, float(rng.uniform(-20, 20)), 0, 360, 70, -1)
+
+    for _ in range(int(rng.integers(2, 5))):
+        x1 = int(rng.uniform(0.2, 0.8) * width)
+        y1 = int(rng.uniform(0.05, 0.3) * height)
+        x2 = int(np.clip(x1 + rng.uniform(-0.2, 0.2) * width, 0, width - 1))
+        y2 = int(rng.uniform(0.7, 0.95) * height)
+        thickness = max(3, int(scale * rng.uniform(0.03, 0.07)))
+        cv2.line(gray, (x1, y1), (x2, y2), int(rng.integers(170, 230)), thickness)
+
+    # Fracture: a thin dark gap across the last bone
+    fy = (y1 + y2) // 2
+    fx = (x1 + x2) // 2
+    cv2.line(gray, (fx - thickness, fy - thickness // 3), (fx + thickness, fy + thickness // 3),
+             40, max(1, thickness // 6))
+
+    gray = cv2.GaussianBlur(gray, (0, 0), max(1.0, scale / 300))
+    noise = rng.normal(0, 6, gray.shape)
+    gray = np.clip(gray.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def synthetic_xray_png(width, height, seed=0):
+    ok, encoded = cv2.imencode('.png', synthetic_xray(width, height, seed))
+    if not ok:
+        raise ValueError("Could not encode synthetic X-ray")
+    return encoded.tobytes()
@@ -37,7 +37,8 @@ CREATE TABLE IF NOT EXISTS `appointments` (
   `status` varchar(50) DEFAULT 'pending',
   PRIMARY KEY (`id`),
   KEY `user_id` (`user_id`),
-  KEY `doctor_id` (`doctor_id`)
+  KEY `doctor_id` (`doctor_id`),
+  KEY `doctor_schedule` (`doctor_id`,`appointment_date`,`appointment_time`)
 ) ENGINE=InnoDB AUTO_INCREMENT=5 DEFAULT CHARSET=latin1;
 
 --
@@ -0,0 +1,207 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+import ingest
+
+# Re-screens a directory tree of X-rays offline and writes one JSON line per
+# image. Paths are streamed from a generator, decoded and enhanced by a pool
+# of worker processes, and the model runs on batches of enhanced images in
+# this process. The output file doubles as the checkpoint: every batch is
+# flushed and fsynced, and a rerun with the same --output skips the images
+# already in it. With --retry-errors failed images are scanned again and
+# their new line is appended, so the last line for a path is the one that counts.
+#
+#   python bulk_scan.py /archive/xrays --output scans/archive.jsonl
+#   python bulk_scan.py /archive/xrays --output scans/archive.jsonl --retry-errors
+
+EXTENSIONS = {'png', 'jpg', 'jpeg'} | ingest.EXTENSIONS
+
+# Preprocessing-only detector, created by _init_worker when the worker starts
+_worker_detector = None
+
+
+def iter_paths(root, extensions=EXTENSIONS):
+    # Depth-first, sorted within each directory so reruns see the same order
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except OSError as e:
+        print(f"Error reading directory {root}: {str(e)}")
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_paths(entry.path, extensions)
+        elif entry.name.rsplit('.', 1)[-1].lower() in extensions:
+            yield entry.path
+
+
+def load_checkpoint(output, retry_errors=False):
+    # Paths already written to output. A line cut short by an interrupted run
+    # is dropped so that appending starts on a clean line.
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, 'rb+') as f:
+        valid = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid += len(line)
+            if record.get('status') == 'ok' or not retry_errors:
+                done.add(record['path'])
+        f.truncate(valid)
+    return done
+
+
+def _init_worker():
+    global _worker_detector
+    import cv2
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    from predict import FractureDetector
+    _worker_detector = FractureDetector(use_cache=False, load_model=False)
+
+
+def _load(path):
+    # Decoded and enhanced single-channel image, or the error message
+    try:
+        data, _ = _worker_detector._read(path)
+        return path, _worker_detector._enhance(_worker_detector._decode(data)), None
+    except Exception as e:
+        return path, None, f"Error processing image: {str(e)}"
+
+
+def load_images(paths, workers, prefetch):
+    # Yields (path, enhanced, error) in input order with at most prefetch
+    # images decoded ahead, so memory stays bounded however large the archive
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(processes=workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.apply_async(_load, (path,)))
+            if len(pending) >= prefetch:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def scan_batch(detector, batch):
+    loaded = [(path, image) for path, image, error in batch if error is None]
+    detections = {}
+    if loaded:
+        try:
+            for (path, _), result in zip(loaded, detector.detect_enhanced([image for _, image in loaded])):
+                detections[path] = result
+        except Exception as e:
+            print(f"Error in detection: {str(e)}")
+            batch = [(path, image, error or f"Error processing image: {str(e)}") for path, image, error in batch]
+
+    records = []
+    for path, image, error in batch:
+        if path in detections:
+            result = detections[path]
+            records.append({'path': path, 'status': 'ok', 'width': result.width, 'height': result.height,
+                            'detections': result.to_list(), 'summary': str(result)})
+        else:
+            records.append({'path': path, 'status': 'error', 'error': error})
+    return records
+
+
+class Progress:
+    # Prints throughput every interval seconds and a summary at the end
+    def __init__(self, interval):
+        self.interval = interval
+        self.skipped = 0
+        self.start = self.last_report = time.perf_counter()
+        self.done = self.errors = self.detections = self.last_done = 0
+
+    def update(self, records):
+        self.done += len(records)
+        self.errors += sum(1 for r in records if r['status'] != 'ok')
+        self.detections += sum(len(r.get('detections', ())) for r in records)
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            recent = (self.done - self.last_done) / (now - self.last_report)
+            print(f"{self.done} scanned ({self.errors} errors, {self.detections} detections), "
+                  f"{recent:.1f} images/s now, {self.rate(now):.1f} images/s overall", file=sys.stderr)
+            self.last_report, self.last_done = now, self.done
+
+    def rate(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.start
+        return self.done / elapsed if elapsed else 0.0
+
+    def summary(self):
+        return {'scanned': self.done, 'skipped': self.skipped, 'errors': self.errors,
+                'detections': self.detections, 'seconds': round(time.perf_counter() - self.start, 3),
+                'images_per_sec': round(self.rate(), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen a directory tree of X-rays for fractures, resumably")
+    parser.add_argument('root', help="directory to scan recursively")
+    parser.add_argument('--output', required=True, help="JSONL results file, also used to resume")
+    parser.add_argument('--batch-size', type=int, default=16, help="images per model call")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="processes decoding and enhancing images")
+    parser.add_argument('--prefetch', type=int, help="images decoded ahead of the model (default 2 batches)")
+    parser.add_argument('--retry-errors', action='store_true', help="rescan images that failed in an earlier run")
+    parser.add_argument('--report-every', type=float, default=10.0, help="seconds between throughput reports")
+    parser.add_argument('--backend', help="inference backend, as for INFERENCE_BACKEND")
+    args = parser.parse_args()
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_checkpoint(args.output, args.retry_errors)
+    if done:
+        print(f"Resuming: {len(done)} images already in {args.output}", file=sys.stderr)
+
+    from predict import FractureDetector
+    detector = FractureDetector(use_cache=False, backend=args.backend)
+    detector.warm_up()
+
+    progress = Progress(args.report_every)
+
+    def todo():
+        for path in iter_paths(args.root):
+            if path in done:
+                progress.skipped += 1
+            else:
+                yield path
+
+    images = load_images(todo(), args.workers, args.prefetch or 2 * args.batch_size)
+    with open(args.output, 'a') as out:
+        try:
+            for batch in batched(images, args.batch_size):
+                records = scan_batch(detector, batch)
+                out.write(''.join(json.dumps(record) + '\n' for record in records))
+                out.flush()
+                os.fsync(out.fileno())
+                progress.update(records)
+        except KeyboardInterrupt:
+            print("Interrupted; rerun with the same --output to resume", file=sys.stderr)
+        finally:
+            images.close()
+            print(json.dumps(progress.summary()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import re
+import threading
+
+from query_cache import TTLCache
+
+SYSTEM_PROMPT = "You are a medical chatbot specializing in bones. Provide information and answer questions related to bone health, fractures, and related medical topics. Do not answer questions outside of this domain."
+
+
+def normalize_question(question):
+    # "How long does a wrist fracture take to heal?" and "how long does a
+    # wrist fracture take to heal" share one cache entry
+    return ' '.join(re.sub(r'[^\w\s]', ' ', question.lower()).split())
+
+
+class ChatService:
+    # One long-lived Mistral client per process, so its HTTP connection pool
+    # is reused across requests, plus an LRU/TTL cache of answers keyed by
+    # the normalized question. server_url points the client at another
+    # endpoint, such as a local stub server in tests.
+    def __init__(self, api_key, model, server_url=None, cache_size=512, cache_ttl=3600):
+        self.api_key = api_key
+        self.model = model
+        self.server_url = server_url
+        self.cache = TTLCache(max_entries=cache_size, ttl=cache_ttl)
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from mistralai import Mistral
+                    kwargs = {'server_url': self.server_url} if self.server_url else {}
+                    self._client = Mistral(api_key=self.api_key, **kwargs)
+        return self._client
+
+    def messages(self, question):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": question}
+        ]
+
+    def ask(self, question):
+        key = normalize_question(question)
+        answer = self.cache.get(key)
+        if answer is None:
+            chat_response = self.client.chat.complete(model=self.model, messages=self.messages(question))
+            answer = chat_response.choices[0].message.content
+            self.cache.set(key, answer)
+        return answer
+
+    def stream(self, question):
+        # Yields the answer in pieces as the model produces them; cached
+        # answers come back as a single piece
+        key = normalize_question(question)
+        answer = self.cache.get(key)
+        if answer is not None:
+            yield answer
+            return
+
+        parts = []
+        for event in self.client.chat.stream(model=self.model, messages=self.messages(question)):
+            delta = event.data.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        self.cache.set(key, ''.join(parts))
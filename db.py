@@ -0,0 +1,236 @@
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def mysql_factory(**config):
+    def connect():
+        import mysql.connector
+        return mysql.connector.connect(**config)
+    return connect
+
+
+class SQLiteCursor:
+    # Accepts the MySQL-style %s placeholders the routes use. SQLite has no
+    # SELECT ... FOR UPDATE; the nearest equivalent is taking the database
+    # write lock up front with BEGIN IMMEDIATE.
+    def __init__(self, conn, cursor):
+        self._conn = conn
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        sql = sql.strip()
+        if sql.upper().endswith(' FOR UPDATE'):
+            sql = sql[:-len(' FOR UPDATE')]
+            if not self._conn.in_transaction:
+                self._cursor.execute('BEGIN IMMEDIATE')
+        self._cursor.execute(sql.replace('%s', '?'), params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    # Local stand-in for the MySQL connection, for tests and load testing
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+
+    def cursor(self):
+        return SQLiteCursor(self._conn, self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        self._conn.execute('SELECT 1')
+
+    def close(self):
+        self._conn.close()
+
+
+def sqlite_factory(path):
+    return lambda: SQLiteConnection(path)
+
+
+def mysql_dump_to_sqlite(dump):
+    # Converts a phpMyAdmin dump such as bonefracture.sql into SQLite statements
+    statements = []
+    indexes = []
+    lines = [line for line in dump.splitlines()
+             if line.strip() and not line.startswith(('--', '/*!', 'SET ', 'START TRANSACTION', 'COMMIT'))]
+    for statement in '\n'.join(lines).split(';\n'):
+        statement = statement.strip().rstrip(';')
+        if not statement or statement.startswith('ALTER TABLE'):
+            continue
+        if statement.startswith('CREATE TABLE'):
+            table = re.search(r'CREATE TABLE (?:IF NOT EXISTS )?`(\w+)`', statement).group(1)
+            head, body = statement.split('(', 1)
+            body = body.rsplit(')', 1)[0]
+            columns = []
+            for line in body.split('\n'):
+                line = line.strip().rstrip(',')
+                if not line:
+                    continue
+                key = re.match(r'(UNIQUE )?KEY `(\w+)` \((.+)\)', line)
+                if key:
+                    unique, name, cols = key.groups()
+                    indexes.append(f'CREATE {unique or ""}INDEX IF NOT EXISTS `{table}_{name}` ON `{table}` ({cols})')
+                    continue
+                line = re.sub(r'\bint NOT NULL AUTO_INCREMENT\b', 'INTEGER NOT NULL', line)
+                line = re.sub(r'\bint\b', 'INTEGER', line)
+                columns.append(line)
+            statement = head + '(\n  ' + ',\n  '.join(columns) + '\n)'
+        statements.append(statement)
+    return statements + indexes
+
+
+def load_mysql_dump(conn, dump_path):
+    with open(dump_path) as f:
+        statements = mysql_dump_to_sqlite(f.read())
+    cursor = conn.cursor()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+class ConnectionPool:
+    # Hands out one connection per request instead of sharing a single global
+    # connection between threads. Connections idle for longer than
+    # health_check_interval are pinged (and reconnected) before reuse;
+    # broken ones are dropped and replaced on the next checkout.
+    def __init__(self, factory, size=10, timeout=5.0, health_check_interval=30.0):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+        self._wait_seconds = metrics.registry.histogram('db_pool_wait_seconds', 'Time spent waiting for a pooled connection')
+        self._reconnects = metrics.registry.counter('db_pool_reconnects_total', 'Pooled connections replaced after a failed health check')
+        self._timeouts = metrics.registry.counter('db_pool_timeouts_total', 'Checkouts that gave up waiting for a connection')
+        metrics.registry.gauge('db_pool_size', 'Connections opened by the pool', callback=lambda: self._created)
+        metrics.registry.gauge('db_pool_in_use', 'Connections currently checked out', callback=lambda: self._in_use)
+
+    def _connect(self):
+        conn = self.factory()
+        return [conn, time.monotonic()]
+
+    def acquire(self):
+        start = time.perf_counter()
+        entry = None
+        try:
+            entry = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    entry = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    entry = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._timeouts.inc()
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+        self._wait_seconds.observe(time.perf_counter() - start)
+
+        conn, last_used = entry
+        if time.monotonic() - last_used > self.health_check_interval:
+            conn = self._healthy(conn)
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            conn.ping(reconnect=True, attempts=1, delay=0)
+            return conn
+        except Exception:
+            self._reconnects.inc()
+            try:
+                conn.close()
+            except Exception:
+                pass
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # End any open transaction so the next user gets a fresh snapshot
+            conn.rollback()
+        except Exception:
+            # The connection is gone; let the pool open a new one later
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        self._idle.put([conn, time.monotonic()])
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._created -= 1
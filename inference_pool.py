@@ -0,0 +1,101 @@
+import math
+import multiprocessing
+import os
+import time
+
+import metrics
+
+# Per-process detector, created by _init_worker when the worker starts
+_worker_detector = None
+_worker_error = None
+
+
+def default_factory():
+    from predict import FractureDetector
+    return FractureDetector()
+
+
+def _init_worker(num_threads, factory):
+    global _worker_detector, _worker_error
+    # Pin intra-op threads before torch and OpenCV build their thread pools
+    os.environ['OMP_NUM_THREADS'] = str(num_threads)
+    import cv2
+    import torch
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(num_threads)
+
+    import predict
+    # Views are rendered by the web process, so sources must be on disk before we answer
+    predict.view_store.async_writes = False
+    # Nothing reads decoded sources kept in a worker, so keep none
+    predict.view_store.max_source_bytes = 0
+    try:
+        _worker_detector = factory()
+        _worker_detector.warm_up()
+    except Exception as e:
+        # Raising here would make the pool respawn the worker forever; fail requests instead
+        print(f"Error initializing inference worker: {str(e)}")
+        _worker_error = str(e)
+
+
+def _detect_batch(images):
+    if _worker_detector is None:
+        raise RuntimeError(f"Inference worker unavailable: {_worker_error}")
+    results = _worker_detector.detect_batch(images)
+    # Stage timings and counters recorded for this batch go back with it
+    return results, metrics.registry.drain()
+
+
+def _ping():
+    return os.getpid()
+
+
+class InferencePool:
+    # A pool of worker processes that each load the model and run a warm-up
+    # pass at startup, so no request pays the model load. detect_batch splits
+    # a batch across the workers and returns results in input order.
+    # A worker that dies mid-task (out of memory, segfault) is replaced by
+    # the pool but its task is never answered, so detect_batch gives up
+    # after task_timeout seconds instead of waiting forever. Metrics recorded
+    # in the workers are merged into this process's registry.
+    def __init__(self, workers=2, threads_per_worker=1, factory=default_factory, task_timeout=None):
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self._lost_tasks = False
+        ctx = multiprocessing.get_context('spawn')
+        self._pool = ctx.Pool(processes=workers, initializer=_init_worker,
+                              initargs=(threads_per_worker, factory))
+
+    def wait_ready(self, timeout=None):
+        # Blocks until every worker has finished loading and warming up the model
+        pending = [self._pool.apply_async(_ping) for _ in range(self.workers)]
+        return {p.get(timeout) for p in pending}
+
+    def detect_batch(self, images):
+        if not images:
+            return []
+        chunk_size = math.ceil(len(images) / self.workers)
+        chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+        pending = [self._pool.apply_async(_detect_batch, (chunk,)) for chunk in chunks]
+        deadline = time.monotonic() + self.task_timeout if self.task_timeout else None
+        results = []
+        for p in pending:
+            try:
+                chunk_results, drained = p.get(None if deadline is None else max(0, deadline - time.monotonic()))
+            except multiprocessing.TimeoutError:
+                self._lost_tasks = True
+                raise RuntimeError(f"Inference worker did not answer within {self.task_timeout:g}s, it may have crashed")
+            results.extend(chunk_results)
+            metrics.registry.merge(drained)
+        return results
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def close(self):
+        # join() would wait forever for a task whose worker died
+        if self._lost_tasks:
+            self._pool.terminate()
+            return
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,315 @@
+import struct
+
+import numpy as np
+
+# 16-bit DICOM and TIFF studies straight from the PACS. Files are memory
+# mapped (uploads are read in place from the request buffer), the header is
+# parsed without touching the pixels, and the pixel data is windowed to
+# 8-bit a block of rows at a time into a single output image, so the only
+# full-size array is the 8-bit result that goes on to enhance_image.
+EXTENSIONS = {'dcm', 'dicom', 'tif', 'tiff'}
+
+# Rows windowed per step, about this many bytes of input at a time
+CHUNK_BYTES = 4 << 20
+# Without a window in the file, pixel values are stretched between these percentiles
+AUTO_WINDOW_PERCENTILES = (0.5, 99.5)
+
+IMPLICIT_VR_LE = '1.2.840.10008.1.2'
+EXPLICIT_VR_LE = '1.2.840.10008.1.2.1'
+EXPLICIT_VR_BE = '1.2.840.10008.1.2.2'
+# Explicit VRs whose length is a 4-byte field after 2 reserved bytes
+LONG_VRS = {b'OB', b'OD', b'OF', b'OL', b'OV', b'OW', b'SQ', b'UC', b'UN', b'UR', b'UT', b'SV', b'UV'}
+UNDEFINED_LENGTH = 0xFFFFFFFF
+ITEM, ITEM_END, SEQUENCE_END = 0xFFFEE000, 0xFFFEE00D, 0xFFFEE0DD
+PIXEL_DATA = 0x7FE00010
+
+# Image pixel module attributes we need, by tag
+DICOM_US = {0x00280002: 'samples', 0x00280010: 'rows', 0x00280011: 'columns', 0x00280100: 'bits_allocated',
+            0x00280101: 'bits_stored', 0x00280103: 'signed'}
+DICOM_TEXT = {0x00020010: 'transfer_syntax', 0x00280004: 'photometric', 0x00280008: 'frames',
+              0x00281050: 'window_center', 0x00281051: 'window_width',
+              0x00281052: 'intercept', 0x00281053: 'slope'}
+
+
+def is_ingest_path(path):
+    return str(path).rsplit('.', 1)[-1].lower() in EXTENSIONS
+
+
+def map_file(path):
+    # Read-only view of the whole file; pages are only read when touched
+    return memoryview(np.memmap(path, dtype=np.uint8, mode='r'))
+
+
+def sniff(data):
+    # 'dicom', 'tiff' or None for other encoded images (PNG, JPEG, ...)
+    head = bytes(data[:132])
+    if head[128:132] == b'DICM':
+        return 'dicom'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    return None
+
+
+def _text(buf, offset, length):
+    return bytes(buf[offset:offset + length]).decode('ascii', 'replace').strip('\x00 ')
+
+
+def _number(value, default):
+    # DS/IS values may be multi-valued ("40\\400"); the first one applies
+    try:
+        return float(value.split('\\')[0]) if value else default
+    except ValueError:
+        return default
+
+
+def _read_elements(buf, offset, end, explicit, order, info, top_level):
+    # Walks data elements from offset to end (or to an item delimiter) and
+    # returns the offset after them. Top-level pixel module attributes are
+    # collected into info; reaching Pixel Data stops the walk.
+    while offset < end:
+        # The file meta group is always explicit VR little endian
+        group, element = struct.unpack_from('<HH', buf, offset)
+        is_meta = group == 0x0002
+        if not is_meta:
+            group, element = struct.unpack_from(order + 'HH', buf, offset)
+        tag = (group << 16) | element
+        if tag in (ITEM_END, SEQUENCE_END):
+            return offset + 8
+        element_order = '<' if is_meta else order
+        if (explicit or is_meta) and group != 0xFFFE:
+            vr = bytes(buf[offset + 4:offset + 6])
+            if vr in LONG_VRS:
+                length = struct.unpack_from(element_order + 'I', buf, offset + 8)[0]
+                offset += 12
+            else:
+                length = struct.unpack_from(element_order + 'H', buf, offset + 6)[0]
+                offset += 8
+        else:
+            length = struct.unpack_from(element_order + 'I', buf, offset + 4)[0]
+            offset += 8
+
+        if tag == PIXEL_DATA and top_level:
+            info['pixel_offset'] = offset
+            info['pixel_length'] = length
+            return offset
+        if tag == ITEM:
+            if length == UNDEFINED_LENGTH:
+                offset = _read_elements(buf, offset, end, explicit, order, info, False)
+            else:
+                offset += length
+            continue
+        if length == UNDEFINED_LENGTH:
+            # A sequence of undefined length; skip its items
+            offset = _read_elements(buf, offset, end, explicit, order, info, False)
+            continue
+
+        if top_level and tag in DICOM_US and length >= 2:
+            info[DICOM_US[tag]] = struct.unpack_from(element_order + 'H', buf, offset)[0]
+        elif top_level and tag in DICOM_TEXT:
+            info[DICOM_TEXT[tag]] = _text(buf, offset, length)
+        if tag == 0x00020010:
+            # The rest of the file is in the transfer syntax named here
+            syntax = info['transfer_syntax']
+            explicit = syntax != IMPLICIT_VR_LE
+            order = '>' if syntax == EXPLICIT_VR_BE else '<'
+            info['explicit'], info['order'] = explicit, order
+        offset += length
+    return offset
+
+
+def read_dicom(buf):
+    # Returns (pixels, settings) where pixels is a zero-copy view into buf
+    info = {'explicit': True, 'order': '<'}
+    _read_elements(buf, 132, len(buf), True, '<', info, True)
+    syntax = info.get('transfer_syntax', EXPLICIT_VR_LE)
+    if syntax not in (IMPLICIT_VR_LE, EXPLICIT_VR_LE, EXPLICIT_VR_BE):
+        # JPEG, JPEG 2000, RLE, deflate: the pixel data has to be decompressed
+        return _read_dicom_compressed(buf), _dicom_settings(info)
+    if 'pixel_offset' not in info:
+        raise ValueError("DICOM file has no pixel data")
+    if info.get('samples', 1) != 1:
+        raise ValueError("Only single-channel (grayscale) DICOM images are supported")
+
+    rows, columns = info['rows'], info['columns']
+    bits = info.get('bits_allocated', 16)
+    if bits not in (8, 16, 32):
+        raise ValueError(f"Unsupported DICOM BitsAllocated: {bits}")
+    kind = 'i' if info.get('signed') else 'u'
+    dtype = np.dtype(f"{info['order']}{kind}{bits // 8}")
+    # Multi-frame studies: the first frame is the one shown
+    pixels = np.frombuffer(buf, dtype=dtype, count=rows * columns, offset=info['pixel_offset'])
+    return pixels.reshape(rows, columns), _dicom_settings(info)
+
+
+def _dicom_settings(info):
+    settings = {
+        'slope': _number(info.get('slope'), 1.0),
+        'intercept': _number(info.get('intercept'), 0.0),
+        'invert': info.get('photometric') == 'MONOCHROME1',
+        'bits_stored': info.get('bits_stored')
+    }
+    center, width = _number(info.get('window_center'), None), _number(info.get('window_width'), None)
+    if center is not None and width:
+        settings['window'] = (center, width)
+    return settings
+
+
+def _read_dicom_compressed(buf):
+    # Optional dependency, only needed for compressed transfer syntaxes
+    try:
+        import io
+        import pydicom
+    except ImportError:
+        raise ValueError("Compressed DICOM needs pydicom (and its pixel data handlers) installed")
+    dataset = pydicom.dcmread(io.BytesIO(bytes(buf)))
+    pixels = dataset.pixel_array
+    return pixels[0] if pixels.ndim == 3 and getattr(dataset, 'NumberOfFrames', 1) > 1 else pixels
+
+
+def read_tiff(buf):
+    # Uncompressed single-channel TIFFs with contiguous strips are mapped in
+    # place; anything else (compressed, tiled, RGB) is decoded by OpenCV
+    order = '<' if bytes(buf[:2]) == b'II' else '>'
+    ifd = struct.unpack_from(order + 'I', buf, 4)[0]
+    count = struct.unpack_from(order + 'H', buf, ifd)[0]
+    sizes = {1: 1, 3: 2, 4: 4}
+    formats = {1: 'B', 3: 'H', 4: 'I'}
+    tags = {}
+    for i in range(count):
+        entry = ifd + 2 + i * 12
+        tag, kind, n = struct.unpack_from(order + 'HHI', buf, entry)
+        if kind not in formats:
+            continue
+        size = sizes[kind] * n
+        value_offset = entry + 8 if size <= 4 else struct.unpack_from(order + 'I', buf, entry + 8)[0]
+        tags[tag] = struct.unpack_from(order + formats[kind] * n, buf, value_offset)
+
+    width, height = tags[256][0], tags[257][0]
+    bits = tags.get(258, (1,))[0]
+    compression = tags.get(259, (1,))[0]
+    photometric = tags.get(262, (1,))[0]
+    samples = tags.get(277, (1,))[0]
+    sample_format = tags.get(339, (1,))[0]
+    offsets, byte_counts = tags.get(273), tags.get(279)
+    settings = {'slope': 1.0, 'intercept': 0.0, 'invert': photometric == 0, 'bits_stored': None}
+
+    contiguous = offsets is not None and byte_counts is not None and all(
+        offsets[i] + byte_counts[i] == offsets[i + 1] for i in range(len(offsets) - 1))
+    kind = {1: 'u', 2: 'i', 3: 'f'}.get(sample_format)
+    if compression == 1 and samples == 1 and contiguous and kind and bits in (8, 16, 32, 64):
+        dtype = np.dtype(f'{order}{kind}{bits // 8}')
+        pixels = np.frombuffer(buf, dtype=dtype, count=width * height, offset=offsets[0])
+        return pixels.reshape(height, width), settings
+
+    import cv2
+    pixels = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_ANYDEPTH | cv2.IMREAD_GRAYSCALE)
+    if pixels is None:
+        raise ValueError("Could not decode TIFF image")
+    return pixels, settings
+
+
+def _stored_values(dtype, bits_stored):
+    # Every value a 1- or 2-byte pixel can hold, indexed by its unsigned bit pattern
+    bits = dtype.itemsize * 8
+    patterns = np.arange(1 << bits, dtype=np.int64)
+    if bits_stored and bits_stored < bits:
+        # Only the low bits_stored bits are pixel data
+        patterns &= (1 << bits_stored) - 1
+        if dtype.kind == 'i':
+            sign = 1 << (bits_stored - 1)
+            patterns = (patterns ^ sign) - sign
+    elif dtype.kind == 'i':
+        patterns = np.where(patterns >= 1 << (bits - 1), patterns - (1 << bits), patterns)
+    return patterns
+
+
+def _auto_window(values, counts):
+    # Window spanning the AUTO_WINDOW_PERCENTILES of the pixel values
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(counts[order])
+    total = cumulative[-1]
+    low_p, high_p = AUTO_WINDOW_PERCENTILES
+    low = values[order[min(np.searchsorted(cumulative, total * low_p / 100), len(order) - 1)]]
+    high = values[order[min(np.searchsorted(cumulative, total * high_p / 100), len(order) - 1)]]
+    return low, max(high, low + 1)
+
+
+def _window_limits(settings, low_high=None):
+    # (low, high) in modality units: the file's VOI window if it has one
+    if 'window' in settings:
+        center, width = settings['window']
+        # DICOM PS3.3 C.11.2.1.2 linear window
+        width = max(width, 2)
+        return center - 0.5 - (width - 1) / 2, center - 0.5 + (width - 1) / 2
+    return low_high
+
+
+def _chunks(pixels):
+    rows = max(1, CHUNK_BYTES // max(1, pixels.shape[1] * pixels.dtype.itemsize))
+    for start in range(0, pixels.shape[0], rows):
+        yield start, min(start + rows, pixels.shape[0])
+
+
+def to_uint8(pixels, settings):
+    # Windows pixels (in place views, any integer or float dtype) to a new
+    # 8-bit image, one block of rows at a time
+    out = np.empty(pixels.shape, dtype=np.uint8)
+    if pixels.dtype.itemsize <= 2 and pixels.dtype.kind in 'ui':
+        # Integer pixels go through a lookup table over every possible value,
+        # built once, so each pixel costs a single table read
+        unsigned = np.dtype(f'u{pixels.dtype.itemsize}')
+        values = _stored_values(pixels.dtype, settings.get('bits_stored')) * settings['slope'] + settings['intercept']
+
+        def indices(start, end):
+            block = pixels[start:end].astype(pixels.dtype.newbyteorder('='), copy=False)
+            return block.view(unsigned)
+
+        limits = _window_limits(settings)
+        if limits is None and pixels.dtype == np.uint8:
+            # Already 8-bit: keep the values as they are
+            limits = (0, 255)
+        if limits is None:
+            counts = np.zeros(len(values), dtype=np.int64)
+            for start, end in _chunks(pixels):
+                counts += np.bincount(indices(start, end).ravel(), minlength=len(values))
+            limits = _auto_window(values, counts)
+        low, high = limits
+        lut = np.clip((values - low) / (high - low) * 255 + 0.5, 0, 255).astype(np.uint8)
+        if settings.get('invert'):
+            lut = 255 - lut
+        for start, end in _chunks(pixels):
+            np.take(lut, indices(start, end), out=out[start:end], mode='clip')
+        return out
+
+    limits = _window_limits(settings)
+    if limits is None:
+        # Percentiles of an evenly strided sample, at most about a million pixels
+        step = max(1, int(np.sqrt(pixels.size / 1e6)))
+        sample = pixels[::step, ::step].astype(np.float32) * settings['slope'] + settings['intercept']
+        limits = tuple(np.percentile(sample, AUTO_WINDOW_PERCENTILES))
+    low, high = limits[0], max(limits[1], limits[0] + 1e-6)
+    scale = 255 / (high - low)
+    for start, end in _chunks(pixels):
+        block = pixels[start:end].astype(np.float32)
+        block *= settings['slope'] * scale
+        block += (settings['intercept'] - low) * scale
+        np.clip(block, 0, 255, out=block)
+        if settings.get('invert'):
+            np.subtract(255, block, out=block)
+        block += 0.5
+        out[start:end] = block
+    return out
+
+
+def decode(data):
+    # DICOM or TIFF bytes (or a mapped file) to an 8-bit grayscale image
+    kind = sniff(data)
+    if kind == 'dicom':
+        pixels, settings = read_dicom(data)
+    elif kind == 'tiff':
+        pixels, settings = read_tiff(data)
+    else:
+        raise ValueError("Not a DICOM or TIFF image")
+    if pixels.ndim != 2:
+        raise ValueError("Only single-channel (grayscale) images are supported")
+    return to_uint8(pixels, settings)
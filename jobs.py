@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+import uuid
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, image):
+        self.id = uuid.uuid4().hex
+        self.image = image
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _complete(self, result=None, error=None):
+        # The upload is not needed any more; the job itself may be kept for job_ttl
+        self.image = None
+        self.result = result
+        self.error = error
+        self.status = 'failed' if error else 'done'
+        self.finished = time.time()
+        self._done.set()
+
+
+class InferenceScheduler:
+    # Collects submitted images into micro-batches and hands each batch to
+    # batch_fn(images) on a background thread. A batch is sent once it is
+    # full or max_wait seconds after its first job arrived. concurrency
+    # threads keep up to that many batches in flight, so a pool of workers
+    # is not left idle while one small batch runs.
+    def __init__(self, batch_fn, max_batch_size=8, max_wait=0.01, max_queue=64, job_ttl=600, concurrency=1):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.job_ttl = job_ttl
+        self.concurrency = concurrency
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._last_prune = 0
+
+    def start(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.concurrency:
+                thread = threading.Thread(target=self._run, name='inference-scheduler-%d' % len(self._threads),
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, image):
+        self.start()
+        job = Job(image)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # Backpressure: refuse new work instead of queueing without bound
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFullError("Inference queue is full, please try again shortly")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _prune(self):
+        # Forget finished jobs nobody polled for within job_ttl seconds; at
+        # most once a second, it runs after every submit and every batch
+        now = time.time()
+        if now - self._last_prune < 1:
+            return
+        self._last_prune = now
+        cutoff = now - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _collect(self):
+        # Prunes while idle too, so finished jobs do not wait for the next upload
+        while True:
+            try:
+                batch = [self._queue.get(timeout=min(self.job_ttl, 60))]
+                break
+            except queue.Empty:
+                with self._lock:
+                    self._prune()
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            for job in batch:
+                job.status = 'running'
+            try:
+                results = self.batch_fn([job.image for job in batch])
+            except Exception as e:
+                print(f"Error in inference batch: {str(e)}")
+                for job in batch:
+                    job._complete(error=str(e))
+                continue
+            for job, result in zip(batch, results):
+                job._complete(result=result)
+            with self._lock:
+                self._prune()
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+
+# Minimal Prometheus-style metrics. Set METRICS_ENABLED=0 to turn every
+# span and counter into a no-op; the /metrics route then stays empty.
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(key)} {value}' for key, value in values]
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.callback is not None:
+            return [f'{self.name} {self.callback()}']
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(key)} {value}' for key, value in values]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        if not ENABLED:
+            return NULL_SPAN
+        return _Timer(self, labels)
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, state in values.items():
+                current = self._values.get(key)
+                if current is None:
+                    self._values[key] = list(state)
+                else:
+                    self._values[key] = [a + b for a, b in zip(current, state)]
+
+    def render(self):
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(key, [("le", "+Inf")])} {state[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {state[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {state[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text, callback=None):
+        return self._get(Gauge, name, help_text, callback=callback)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def drain(self):
+        # Counter and histogram values recorded since the last drain, which
+        # starts them from zero again. Inference pool workers send these back
+        # with every batch so that /metrics in the web process includes them.
+        with self._lock:
+            metrics = [m for m in self._metrics.values() if m.kind in ('counter', 'histogram')]
+        drained = []
+        for metric in metrics:
+            values = metric.drain()
+            if values:
+                drained.append((metric.kind, metric.name, metric.help, getattr(metric, 'buckets', None), values))
+        return drained
+
+    def merge(self, drained):
+        # Adds the output of another process's drain() to this registry
+        for kind, name, help_text, buckets, values in drained:
+            if kind == 'counter':
+                self.counter(name, help_text).merge(values)
+            else:
+                self.histogram(name, help_text, buckets).merge(values)
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram('fracture_stage_seconds', 'Time spent in each stage of the detection pipeline')
+detections_total = registry.counter('fracture_detections_total', 'Detections reported, by class')
+errors_total = registry.counter('fracture_errors_total', 'Errors in the detection pipeline, by stage')
+
+
+def span(stage):
+    # with span('inference'): ... records the block's duration under stage
+    if not ENABLED:
+        return NULL_SPAN
+    return _Timer(stage_seconds, {'stage': stage})
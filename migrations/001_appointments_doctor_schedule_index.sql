@@ -0,0 +1,5 @@
+-- Composite index used by the booking conflict check in appointments.py.
+-- Apply to databases created from bonefracture.sql before this index was added.
+
+ALTER TABLE `appointments`
+  ADD KEY `doctor_schedule` (`doctor_id`,`appointment_date`,`appointment_time`);
@@ -1,143 +1,434 @@
 import os
-import torch
-from ultralytics import YOLO
+import threading
 import cv2
 import numpy as np
-from PIL import Image
+from result_cache import ResultCache, file_fingerprint
+from views import ViewStore, content_key
+from tiling import tile_grid, merge_detections
+import ingest
+from backends import export_model
+from metrics import span, detections_total, errors_total
+
+MODEL_PATH = 'bonefracture_yolov8.pt'
+
+# enhance_image used to scale to float32 and back before CLAHE. The same
+# arithmetic on all 256 levels gives the lookup table for that round trip;
+# it is the identity with IEEE float32, in which case the step is skipped.
+_levels = np.arange(256, dtype=np.uint8)
+ROUND_TRIP_LUT = ((_levels.astype(np.float32) / 255.0) * 255).astype(np.uint8)
+if np.array_equal(ROUND_TRIP_LUT, _levels):
+    ROUND_TRIP_LUT = None
+
+# Per-thread CLAHE object and scratch buffers; OpenCV's CLAHE is not thread-safe
+_local = threading.local()
+
+
+def _scratch(name, shape):
+    # Reusable uint8 buffer, reallocated only when the image size changes
+    buffer = getattr(_local, name, None)
+    if buffer is None or buffer.shape != shape:
+        buffer = np.empty(shape, dtype=np.uint8)
+        setattr(_local, name, buffer)
+    return buffer
+
+
+def _clahe():
+    clahe = getattr(_local, 'clahe', None)
+    if clahe is None:
+        clahe = _local.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    return clahe
+
+class Detections:
+    # Detections for one image, kept as a structured array in model order.
+    # Iterating yields (x1, y1, x2, y2, conf, class_name) tuples; the text
+    # summary shown on the enquiry page is only built when str() is called.
+    __slots__ = ('records', 'class_names', 'width', 'height')
+    dtype = np.dtype([('x1', np.int32), ('y1', np.int32), ('x2', np.int32), ('y2', np.int32),
+                      ('conf', np.float32), ('cls', np.int16), ('upper', np.bool_), ('left', np.bool_)])
+
+    def __init__(self, records, class_names, width, height):
+        self.records = records
+        self.class_names = class_names
+        self.width = width
+        self.height = height
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        for x1, y1, x2, y2, conf, cls, _, _ in self.records.tolist():
+            yield x1, y1, x2, y2, conf, self.class_names[cls]
+
+    def ranked(self):
+        # Highest confidence first, ties keep model order
+        return self.records[np.argsort(-self.records['conf'], kind='stable')]
+
+    def to_list(self):
+        return [{
+            'class': self.class_names[cls],
+            'confidence': round(conf, 4),
+            'box': [x1, y1, x2, y2],
+            'region': 'upper' if upper else 'lower',
+            'side': 'left' if left else 'right'
+        } for x1, y1, x2, y2, conf, cls, upper, left in self.ranked().tolist()]
+
+    def to_dict(self):
+        return {'width': self.width, 'height': self.height, 'records': self.records.tolist()}
+
+    @classmethod
+    def from_dict(cls, data, class_names):
+        records = np.array([tuple(r) for r in data['records']], dtype=cls.dtype)
+        return cls(records, class_names, data['width'], data['height'])
+
+    def __str__(self):
+        # Prepare result message
+        if len(self.records) == 0:
+            return "No fractures detected in the image"
+        result = f"Found {len(self.records)} detection(s)\n"
+        result += "\nDetected fractures:"
+        for i, (_, _, _, _, conf, cls, upper, left) in enumerate(self.ranked().tolist(), 1):
+            region = "upper" if upper else "lower"
+            side = "left" if left else "right"
+            result += f"\n{i}. {self.class_names[cls]} ({region}-{side} region)"
+            result += f"\n   Confidence: {conf:.2f}"
+        result += "\n\nColor Legend:"
+        result += "\n- Blue: Elbow fracture"
+        result += "\n- Green: Fingers fracture"
+        result += "\n- Orange: Forearm fracture"
+        result += "\n- Purple: Humerus fracture"
+        result += "\n- Yellow: Shoulder fracture"
+        result += "\n- Pink: Wrist fracture"
+        return result
 
 class FractureDetector:
-    def __init__(self):
-        self.model = None
+    def __init__(self, use_cache=True, backend=None, int8=None, calibration_dir=None, model=None, load_model=True):
+        # model lets callers (benchmarks, tests) supply an already loaded YOLO model;
+        # load_model=False gives a detector that can only preprocess (bulk_scan workers)
+        self.model = model
+        # Serving runtime: 'torch' (default), 'onnx' or 'openvino', optionally INT8 quantized
+        self.backend = backend or os.environ.get('INFERENCE_BACKEND', 'torch')
+        self.int8 = int8 if int8 is not None else os.environ.get('INFERENCE_INT8', '0') == '1'
+        self.calibration_dir = calibration_dir or os.environ.get('CALIBRATION_DIR')
         self.class_names = ['elbow positive', 'fingers positive', 'forearm fracture', 
                            'humerus fracture', 'humerus', 'shoulder fracture', 'wrist positive']
-        self.initialize_model()
+        # Inference settings and the accepted box size as a percentage of the image area
+        self.conf = 0.25
+        self.iou = 0.45
+        self.min_area_percentage = 0.1
+        self.max_area_percentage = 30
+        # Sliced inference: images larger than tile_size pixels on either side are
+        # also run as overlapping tile_size tiles, tile_batch tiles per model call,
+        # and the boxes merged across tiles. 0 turns tiling off.
+        self.tile_size = int(os.environ.get('INFERENCE_TILE_SIZE', 0))
+        self.tile_overlap = float(os.environ.get('INFERENCE_TILE_OVERLAP', 0.2))
+        self.tile_batch = int(os.environ.get('INFERENCE_TILE_BATCH', 8))
+        # Drop a box that lies mostly inside a stronger one of the same class
+        self.tile_merge_ios = 0.8
+        # Fingerprint of the weights behind self.model, taken when it is loaded;
+        # keys the result cache. A supplied model is assumed to come from MODEL_PATH.
+        self.weights_fingerprint = None
+        if self.model is None and load_model:
+            self.initialize_model()
+        elif self.model is not None:
+            try:
+                self.weights_fingerprint = file_fingerprint(MODEL_PATH)
+            except OSError:
+                pass
+        self.cache = None
+        if use_cache and os.environ.get('RESULT_CACHE', '1') != '0':
+            self.cache = ResultCache(self.weights_fingerprint, {
+                'conf': self.conf,
+                'iou': self.iou,
+                'min_area_percentage': self.min_area_percentage,
+                'max_area_percentage': self.max_area_percentage,
+                'tile_size': self.tile_size,
+                'tile_overlap': self.tile_overlap,
+                'class_names': self.class_names,
+                'backend': self.backend,
+                'int8': self.int8,
+                'result_format': 'detections'
+            })
 
     def initialize_model(self):
-        if os.path.exists('bonefracture_yolov8.pt'):
-            self.model = YOLO('bonefracture_yolov8.pt')
+        if os.path.exists(MODEL_PATH):
+            # Imported here so that importing this module does not load torch
+            from ultralytics import YOLO
+            # The weights are hashed once, around loading them, and the hash stays
+            # with this model until the next restart even if the file is replaced;
+            # a file replaced while loading is loaded again
+            while True:
+                st = os.stat(MODEL_PATH)
+                self.weights_fingerprint = file_fingerprint(MODEL_PATH)
+                # Exported once per weights file, see backends.export_model
+                self.model_path = export_model(MODEL_PATH, self.backend, self.int8, self.calibration_dir,
+                                               preprocess=self._prepare, class_names=self.class_names)
+                self.model = YOLO(self.model_path, task='detect')
+                loaded = os.stat(MODEL_PATH)
+                if (loaded.st_size, loaded.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                    break
         else:
             raise FileNotFoundError("Trained model 'bonefracture_yolov8.pt' not found. Please place it in the project root directory.")
         
-    def enhance_image(self, image):
-        # Convert to float32
-        float_img = image.astype(np.float32) / 255.0
-        
-        # Apply CLAHE for better contrast
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-        enhanced = clahe.apply((float_img * 255).astype(np.uint8))
-        
-        return enhanced
+    def warm_up(self):
+        # One inference on a blank image so the first real request does not pay
+        # for lazy initialisation inside torch/ultralytics
+        blank = np.zeros((640, 640, 3), dtype=np.uint8)
+        self.model(blank, conf=self.conf, iou=self.iou, verbose=False)
+
+    def enhance_image(self, image, out=None):
+        # Apply CLAHE for better contrast, into out if given
+        if ROUND_TRIP_LUT is not None:
+            image = cv2.LUT(image, ROUND_TRIP_LUT, dst=_scratch('round_trip', image.shape))
+        if out is None:
+            return _clahe().apply(image)
+        return _clahe().apply(image, dst=out)
+
+    def _error_result(self, message):
+        return None, None, None, None, message
+
+    def _read(self, image):
+        # Returns the raw input (encoded bytes or an already decoded BGR array) and the
+        # path of the persisted original, if there is one. Uploads are passed in as
+        # bytes straight from the request, so nothing touches the disk before inference.
+        if isinstance(image, (np.ndarray, bytes, bytearray, memoryview)):
+            return image, None
+        if ingest.is_ingest_path(image):
+            # DICOM/TIFF studies are mapped rather than read; the windowed 8-bit
+            # image is what gets persisted for the views
+            with span('read'):
+                return ingest.map_file(image), None
+        with span('read'), open(image, 'rb') as f:
+            return f.read(), image
+
+    def _decode(self, data):
+        if isinstance(data, np.ndarray):
+            return data
+        if ingest.sniff(data):
+            # 16-bit DICOM/TIFF, windowed to a single-channel 8-bit image
+            with span('decode'):
+                return ingest.decode(data)
+        with span('decode'):
+            original_img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if original_img is None:
+            raise ValueError("Could not load image")
+        return original_img
+
+    def _grayscale(self, original_img):
+        # Convert to grayscale
+        with span('grayscale'):
+            if original_img.ndim == 2:
+                return original_img
+            return cv2.cvtColor(original_img, cv2.COLOR_BGR2GRAY)
+
+    def _enhance(self, original_img, out=None):
+        gray = self._grayscale(original_img)
+        # Enhance image
+        with span('enhance'):
+            return self.enhance_image(gray, out)
+
+    def _prepare(self, original_img):
+        # Create a 3-channel image for YOLO input; the single-channel enhanced
+        # image is only an intermediate here, so it goes to a reused buffer
+        enhanced = self._enhance(original_img, out=_scratch('enhanced', original_img.shape[:2]))
+        return cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
+
+    def _tiled(self, original_img):
+        height, width = original_img.shape[:2]
+        return self.tile_size > 0 and max(height, width) > self.tile_size
+
+    def _rows(self, results):
+        # One device-to-host copy per result, as rows of (x1, y1, x2, y2, conf, cls)
+        data = [r.boxes.data.cpu().numpy() for r in results]
+        if not data:
+            return np.empty((0, 6), dtype=np.float32)
+        data = np.concatenate(data)
+        # Tracking results carry an extra track id column before conf
+        return np.concatenate((data[:, :4], data[:, -2:]), axis=1)
+
+    def _detect_tiled(self, enhanced):
+        # Runs the model on a downscaled copy of the whole image, for fractures
+        # bigger than a tile, and on every tile at full resolution. Only
+        # tile_batch 3-channel tiles exist at a time, however big the image.
+        height, width = enhanced.shape[:2]
+        scale = self.tile_size / max(height, width)
+        with span('tile_prepare'):
+            overview = cv2.resize(enhanced, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                  interpolation=cv2.INTER_AREA)
+            overview = cv2.cvtColor(overview, cv2.COLOR_GRAY2RGB)
+        with span('tile_inference'):
+            result = self.model([overview], conf=self.conf, iou=self.iou, verbose=False)
+        rows = [self._rows(result)]
+        rows[0][:, :4] /= scale
+
+        tiles = tile_grid(width, height, self.tile_size, self.tile_overlap)
+        for start in range(0, len(tiles), self.tile_batch):
+            batch = tiles[start:start + self.tile_batch]
+            with span('tile_prepare'):
+                crops = [cv2.cvtColor(enhanced[y1:y2, x1:x2], cv2.COLOR_GRAY2RGB) for x1, y1, x2, y2 in batch]
+            with span('tile_inference'):
+                results = self.model(crops, conf=self.conf, iou=self.iou, verbose=False)
+            for (x1, y1, _, _), r in zip(batch, results):
+                tile_rows = self._rows([r])
+                tile_rows[:, [0, 2]] += x1
+                tile_rows[:, [1, 3]] += y1
+                rows.append(tile_rows)
+            del crops, results
+
+        with span('tile_merge'):
+            return merge_detections(np.concatenate(rows), self.iou, self.tile_merge_ios)
+
+    def _extract(self, original_img, data):
+        # data holds rows of (x1, y1, x2, y2, conf, cls) in image coordinates
+        height, width = original_img.shape[:2]
+
+        # int() truncation of the box corners, then the area filter, all vectorized
+        boxes = data[:, :4].astype(np.int64)
+        cls = data[:, -1].astype(np.int64)
+        area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        area_percentage = (area / (width * height)) * 100
+        keep = ((area_percentage >= self.min_area_percentage) &
+                (area_percentage <= self.max_area_percentage) &
+                (cls >= 0) & (cls < len(self.class_names)))
+
+        records = np.empty(int(keep.sum()), dtype=Detections.dtype)
+        records['x1'], records['y1'], records['x2'], records['y2'] = boxes[keep].T
+        records['conf'] = data[keep, -2]
+        records['cls'] = cls[keep]
+        records['upper'] = records['y1'] < height / 2
+        records['left'] = records['x1'] < width / 2
+        return Detections(records, self.class_names, width, height)
+
+    def _finish(self, key, data, original_img, source_path, rows):
+        with span('postprocess'):
+            detections = self._extract(original_img, rows)
+        if len(detections):
+            for cls, count in enumerate(np.bincount(detections.records['cls'], minlength=len(self.class_names))):
+                if count:
+                    detections_total.inc(int(count), **{'class': self.class_names[cls]})
+        # Derived images are rendered on first request, see views.ViewStore
+        with span('register_views'):
+            view_store.register(key, detections, image=original_img, source_path=source_path,
+                                source=None if isinstance(data, np.ndarray) or ingest.sniff(data) else data)
+        return (view_store.url('processed', key), view_store.url('grayscale', key),
+                view_store.url('thresholded', key), view_store.url('binary', key), detections)
+
+    def detect_raw(self, images):
+        # Detections for each image, without touching the result cache or the view store
+        return self.detect_enhanced([self._enhance(self._decode(self._read(image)[0])) for image in images])
+
+    def detect_enhanced(self, images):
+        # Detections for images that already went through _enhance; only their
+        # size matters for the box filter, so the originals are not needed
+        rows = [None] * len(images)
+        whole = [i for i, img in enumerate(images) if not self._tiled(img)]
+        if whole:
+            with span('inference'):
+                results = self.model([cv2.cvtColor(images[i], cv2.COLOR_GRAY2RGB) for i in whole],
+                                     conf=self.conf, iou=self.iou, verbose=False)
+            for i, r in zip(whole, results):
+                rows[i] = self._rows([r])
+        for i, img in enumerate(images):
+            if rows[i] is None:
+                rows[i] = self._detect_tiled(img)
+        return [self._extract(img, r) for img, r in zip(images, rows)]
 
     def detect_fracture(self, image_path):
-        try:
-            # Read image
-            original_img = cv2.imread(image_path)
-            if original_img is None:
-                return None, None, None, None, None, "Error: Could not load image"
-
-            # Convert to grayscale
-            gray = cv2.cvtColor(original_img, cv2.COLOR_BGR2GRAY)
-
-            # Save grayscale image
-            grayscale_path = os.path.join('static', 'processed', 'grayscale_' + os.path.basename(image_path))
-            cv2.imwrite(grayscale_path, gray)
-
-            # Thresholded image (Otsu's threshold)
-            _, thresh_img = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            thresholded_path = os.path.join('static', 'processed', 'thresholded_' + os.path.basename(image_path))
-            cv2.imwrite(thresholded_path, thresh_img)
-
-            # Binary image (simple binary threshold)
-            _, binary_img = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-            binary_path = os.path.join('static', 'processed', 'binary_' + os.path.basename(image_path))
-            cv2.imwrite(binary_path, binary_img)
-
-            # Enhance image
-            enhanced = self.enhance_image(gray)
-            # Create a 3-channel image for YOLO input
-            enhanced_3ch = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
-            # Run inference with higher confidence threshold
-            results = self.model(enhanced_3ch, conf=0.25, iou=0.45)
-            # Process results
-            result_img = original_img.copy()
-            detections = []
-            # Get image dimensions
-            height, width = result_img.shape[:2]
-            for r in results:
-                boxes = r.boxes
-                for box in boxes:
-                    cls = int(box.cls[0].cpu().numpy())
-                    conf = float(box.conf[0].cpu().numpy())
-                    class_name = self.class_names[cls]
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    area = (x2 - x1) * (y2 - y1)
-                    area_percentage = (area / (width * height)) * 100
-                    if 0.1 <= area_percentage <= 30:
-                        detections.append((x1, y1, x2, y2, conf, class_name))
-                        color = (0, 0, 255)
-                        if 'elbow' in class_name:
-                            color = (255, 0, 0)
-                        elif 'fingers' in class_name:
-                            color = (0, 255, 0)
-                        elif 'forearm' in class_name:
-                            color = (255, 165, 0)
-                        elif 'humerus' in class_name:
-                            color = (128, 0, 128)
-                        elif 'shoulder' in class_name:
-                            color = (255, 255, 0)
-                        elif 'wrist' in class_name:
-                            color = (255, 192, 203)
-                        cv2.rectangle(result_img, (x1, y1), (x2, y2), color, 2)
-                        label = f'{class_name} {conf:.2f}'
-                        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                        cv2.rectangle(result_img, (x1, y1-20), (x1+w, y1), color, -1)
-                        cv2.putText(result_img, label, (x1, y1-5),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-                        center_x = (x1 + x2) // 2
-                        center_y = (y1 + y2) // 2
-                        cross_size = 10
-                        cv2.line(result_img, 
-                               (center_x - cross_size, center_y),
-                               (center_x + cross_size, center_y),
-                               color, 2)
-                        cv2.line(result_img,
-                               (center_x, center_y - cross_size),
-                               (center_x, center_y + cross_size),
-                               color, 2)
-            # Save the processed image
-            output_path = os.path.join('static', 'processed', os.path.basename(image_path))
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            cv2.imwrite(output_path, result_img)
-            # Prepare result message
-            if len(detections) > 0:
-                detections.sort(key=lambda x: x[4], reverse=True)
-                result = f"Found {len(detections)} detection(s)\n"
-                result += "\nDetected fractures:"
-                for i, (x1, y1, x2, y2, conf, class_name) in enumerate(detections, 1):
-                    region = "upper" if y1 < height/2 else "lower"
-                    side = "left" if x1 < width/2 else "right"
-                    result += f"\n{i}. {class_name} ({region}-{side} region)"
-                    result += f"\n   Confidence: {conf:.2f}"
-                result += "\n\nColor Legend:"
-                result += "\n- Blue: Elbow fracture"
-                result += "\n- Green: Fingers fracture"
-                result += "\n- Orange: Forearm fracture"
-                result += "\n- Purple: Humerus fracture"
-                result += "\n- Yellow: Shoulder fracture"
-                result += "\n- Pink: Wrist fracture"
-            else:
-                result = "No fractures detected in the image"
-            return output_path, grayscale_path, thresholded_path, binary_path, result
-        except Exception as e:
-            print(f"Error in detection: {str(e)}")
-            return None, None, None, None, None, f"Error processing image: {str(e)}"
+        return self.detect_batch([image_path])[0]
+
+    def detect_batch(self, images):
+        # Preprocess every image first, then run the model once for the whole batch.
+        # Returns one (output, grayscale, thresholded, binary, result) tuple per input,
+        # where the first four are URLs of lazily rendered views.
+        outputs = [None] * len(images)
+        prepared = []
+        # Inputs whose results go into the result cache
+        cacheable = set()
+        for i, image in enumerate(images):
+            try:
+                data, source_path = self._read(image)
+                key = None
+                if self.cache is not None:
+                    # Identical image, weights and settings: reuse the stored result and skip the model
+                    with span('cache_lookup'):
+                        key = self.cache.key(data)
+                        cached = self.cache.get(key) if key is not None else None
+                    if cached is not None and view_store.available(key):
+                        outputs[i] = tuple(cached[:4]) + (Detections.from_dict(cached[4], self.class_names),)
+                        continue
+                    if key is not None:
+                        cacheable.add(i)
+                if key is None:
+                    key = content_key(data)
+                original_img = self._decode(data)
+                # Tiled images keep only the single-channel enhanced image until their tiles are cut
+                tiled = self._tiled(original_img)
+                model_input = self._enhance(original_img) if tiled else self._prepare(original_img)
+                prepared.append((i, key, data, original_img, source_path, model_input, tiled))
+            except Exception as e:
+                print(f"Error in detection: {str(e)}")
+                errors_total.inc(stage='preprocess')
+                outputs[i] = self._error_result(f"Error processing image: {str(e)}")
+
+        rows = {}
+        whole = [p for p in prepared if not p[6]]
+        if whole:
+            try:
+                # Run inference with higher confidence threshold
+                with span('inference'):
+                    results = self.model([p[5] for p in whole], conf=self.conf, iou=self.iou)
+                for p, r in zip(whole, results):
+                    rows[p[0]] = self._rows([r])
+            except Exception as e:
+                print(f"Error in detection: {str(e)}")
+                errors_total.inc(len(whole), stage='inference')
+                for p in whole:
+                    outputs[p[0]] = self._error_result(f"Error processing image: {str(e)}")
+
+        for p in prepared:
+            if p[6]:
+                try:
+                    rows[p[0]] = self._detect_tiled(p[5])
+                except Exception as e:
+                    print(f"Error in detection: {str(e)}")
+                    errors_total.inc(stage='inference')
+                    outputs[p[0]] = self._error_result(f"Error processing image: {str(e)}")
+
+        for i, key, data, original_img, source_path, _, _ in prepared:
+            if i in rows:
+                try:
+                    outputs[i] = self._finish(key, data, original_img, source_path, rows[i])
+                    if i in cacheable:
+                        self.cache.put(key, outputs[i][:4] + (outputs[i][4].to_dict(),))
+                except Exception as e:
+                    print(f"Error in detection: {str(e)}")
+                    errors_total.inc(stage='postprocess')
+                    outputs[i] = self._error_result(f"Error processing image: {str(e)}")
+        return outputs
 
 # Initialize the detector as a global variable
 detector = None
+view_store = ViewStore(
+    persist_sources=os.environ.get('PERSIST_UPLOADS', '1') != '0',
+    image_format=os.environ.get('ARTIFACT_FORMAT', 'png'),
+    png_compression=os.environ.get('ARTIFACT_PNG_COMPRESSION') or None,
+    quality=os.environ.get('ARTIFACT_QUALITY') or None,
+    # Decoded uploads kept in memory for rendering their views
+    max_source_bytes=int(os.environ.get('ARTIFACT_SOURCE_CACHE_MB', 256)) * 1024 * 1024,
+    # Uploads and rendered views are kept for a week within 2 GB by default;
+    # set either to 0 to lift that limit
+    max_bytes=int(os.environ.get('ARTIFACT_MAX_MB', 2048)) * 1024 * 1024 or None,
+    ttl=float(os.environ.get('ARTIFACT_TTL_HOURS', 168)) * 3600 or None,
+    gc_interval=float(os.environ.get('ARTIFACT_GC_INTERVAL', 300))
+)
 
 def process_xray(image_path):
     global detector
     if detector is None:
         detector = FractureDetector()
-    return detector.detect_fracture(image_path)
\ No newline at end of file
+    return detector.detect_fracture(image_path)
+
+def process_xray_batch(images):
+    global detector
+    if detector is None:
+        detector = FractureDetector()
+    return detector.detect_batch(images)
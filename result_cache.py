@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+
+def file_fingerprint(path):
+    # Short content hash of a weights file
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    # Two-tier cache of detection results keyed by image content, model
+    # weights and inference settings. The memory tier is an LRU of recent
+    # results, the disk tier is a directory of JSON files trimmed to
+    # max_disk_bytes (least recently used first). Entries are stored under
+    # a directory named after the fingerprint of the weights the model was
+    # loaded from (see file_fingerprint), so results cached for other weights
+    # are never served and are removed on first use. The fingerprint is
+    # taken once, when the model is loaded: hashing the file at lookup time
+    # would file a running model's results under weights swapped in since.
+    # None (weights unknown or unreadable) turns the cache off.
+    # The disk size is tracked as a running total; only when it passes
+    # max_disk_bytes is the directory scanned and trimmed, to 90% of it.
+    def __init__(self, fingerprint, settings, cache_dir=os.path.join('cache', 'results'),
+                 max_entries=256, max_disk_bytes=256 * 1024 * 1024):
+        self.fingerprint = fingerprint
+        self.settings = json.dumps(settings, sort_keys=True)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._purged = False
+        self._disk_bytes = {}
+
+    def key(self, data):
+        # data is the raw encoded image bytes (possibly a mapped file) or a decoded numpy array.
+        # None when the weights are unknown: skip the cache.
+        if self.fingerprint is None:
+            return None
+        if not self._purged:
+            self._purged = True
+            self._purge_stale(self.fingerprint)
+        digest = hashlib.sha256()
+        if hasattr(data, 'dtype'):
+            digest.update(f'{data.shape}{data.dtype}'.encode())
+            data = data.tobytes()
+        digest.update(data)
+        digest.update(self.settings.encode())
+        return self.fingerprint + '-' + digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                value = tuple(json.load(f))
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        with self._lock:
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+
+        path = self._disk_path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            # Unique per process and thread: pool workers share the directory
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(list(value), f)
+                written = f.tell()
+            os.replace(tmp_path, path)
+            total = self._disk_bytes.get(directory)
+            total = self._scan_disk(directory)[0] if total is None else total + written - replaced
+            if total > self.max_disk_bytes:
+                total = self._evict_disk(directory)
+            self._disk_bytes[directory] = total
+        except OSError as e:
+            print(f"Error writing result cache: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self._disk_bytes.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        fingerprint, digest = key.split('-', 1)
+        return os.path.join(self.cache_dir, fingerprint, digest + '.json')
+
+    def _purge_stale(self, fingerprint):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.listdir(self.cache_dir):
+            if entry != fingerprint:
+                shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+
+    def _scan_disk(self, directory):
+        entries = []
+        total = 0
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.json'):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        return total, entries
+
+    def _evict_disk(self, directory):
+        # Least recently used first, down to 90% of the budget so the next
+        # scan is many puts away; returns the bytes left
+        total, entries = self._scan_disk(directory)
+        target = self.max_disk_bytes * 0.9
+        if total <= self.max_disk_bytes:
+            return total
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
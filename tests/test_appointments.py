@@ -0,0 +1,95 @@
+import os
+import threading
+
+import pytest
+
+from appointments import AppointmentIndex, SlotConflict
+from db import load_mysql_dump, sqlite_factory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def connect(tmp_path):
+    factory = sqlite_factory(str(tmp_path / 'app.db'))
+    conn = factory()
+    load_mysql_dump(conn, os.path.join(ROOT, 'bonefracture.sql'))
+    conn.close()
+    return factory
+
+
+def count(conn, doctor_id, day):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM appointments WHERE doctor_id = %s AND appointment_date = %s",
+                       (doctor_id, day))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def test_book_rejects_slot_within_window(connect):
+    index = AppointmentIndex()
+    conn = connect()
+    index.book(conn, 1, 1, '2031-03-01', '10:00')
+    with pytest.raises(SlotConflict):
+        index.book(conn, 2, 1, '2031-03-01', '10:20')
+    index.book(conn, 2, 1, '2031-03-01', '10:30')
+    assert count(conn, 1, '2031-03-01') == 2
+
+
+def test_concurrent_bookings_for_one_slot(connect):
+    # Two indexes stand for two app processes; each has its own connection
+    # and has already read the day, so only the database can break the tie
+    indexes = [AppointmentIndex(), AppointmentIndex()]
+    conns = [connect(), connect()]
+    for index, conn in zip(indexes, conns):
+        index.warm(conn, '2031-01-01')
+
+    for hour in range(8, 18):
+        barrier = threading.Barrier(2)
+        outcomes = []
+
+        def book(index, conn, user_id):
+            barrier.wait()
+            try:
+                outcomes.append(index.book(conn, user_id, 1, '2031-04-01', '%02d:00' % hour))
+            except SlotConflict:
+                outcomes.append('conflict')
+
+        threads = [threading.Thread(target=book, args=(index, conn, user_id))
+                   for user_id, (index, conn) in enumerate(zip(indexes, conns), 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(outcomes, key=str).count('conflict') == 1
+
+    assert count(conns[0], 1, '2031-04-01') == 10
+
+
+def test_unrejecting_checks_the_slot_again(connect):
+    index = AppointmentIndex()
+    conn = connect()
+    first = index.book(conn, 1, 1, '2031-05-01', '10:00')
+    assert index.set_status(conn, first, 'rejected', 1)
+    # The rejected appointment no longer blocks its slot
+    second = index.book(conn, 2, 1, '2031-05-01', '10:00')
+    with pytest.raises(SlotConflict):
+        index.set_status(conn, first, 'accepted', 1)
+    assert index.set_status(conn, second, 'accepted', 1)
+    # Once the new booking is rejected the first one can be taken back
+    assert index.set_status(conn, second, 'rejected', 1)
+    assert index.set_status(conn, first, 'accepted', 1)
+    with pytest.raises(SlotConflict):
+        index.book(conn, 3, 1, '2031-05-01', '10:15')
+
+
+def test_set_status_only_for_the_doctors_own_appointments(connect):
+    index = AppointmentIndex()
+    conn = connect()
+    appointment_id = index.book(conn, 1, 1, '2031-06-01', '09:00')
+    assert not index.set_status(conn, appointment_id, 'rejected', 2)
+    assert not index.set_status(conn, 999999, 'rejected', 1)
+    with pytest.raises(SlotConflict):
+        index.book(conn, 2, 1, '2031-06-01', '09:00')
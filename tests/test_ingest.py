@@ -0,0 +1,136 @@
+import ast
+import os
+import struct
+
+import numpy as np
+import pytest
+
+import ingest
+
+
+def element(group, elem, vr, value, explicit=True, order='<'):
+    if isinstance(value, str):
+        value = value.encode()
+        value += b' ' * (len(value) % 2)
+    if not explicit:
+        return struct.pack(order + 'HHI', group, elem, len(value)) + value
+    if vr in ingest.LONG_VRS:
+        return struct.pack(order + 'HH', group, elem) + vr + b'\0\0' + struct.pack(order + 'I', len(value)) + value
+    return struct.pack(order + 'HH', group, elem) + vr + struct.pack(order + 'H', len(value)) + value
+
+
+def dicom(pixels, transfer_syntax=ingest.EXPLICIT_VR_LE, bits_stored=12, window=None,
+          monochrome1=False, sequence=False):
+    # A minimal uncompressed single-frame DICOM file; the meta group is
+    # always explicit little endian, the data set uses transfer_syntax
+    explicit = transfer_syntax != ingest.IMPLICIT_VR_LE
+    order = '>' if transfer_syntax == ingest.EXPLICIT_VR_BE else '<'
+    signed = pixels.dtype.kind == 'i'
+    uid = transfer_syntax + ('\0' if len(transfer_syntax) % 2 else '')
+    meta = element(0x0002, 0x0010, b'UI', uid)
+    out = b'\0' * 128 + b'DICM' + element(0x0002, 0x0000, b'UL', struct.pack('<I', len(meta))) + meta
+
+    def add(group, elem, vr, value):
+        return element(group, elem, vr, value, explicit, order)
+
+    def us(value):
+        return struct.pack(order + 'H', value)
+
+    if sequence:
+        # Undefined-length sequence and item; the Rows tag inside must not
+        # be mistaken for the image's own
+        out += struct.pack(order + 'HH', 0x0008, 0x1140) + (b'SQ\0\0' if explicit else b'')
+        out += struct.pack(order + 'I', ingest.UNDEFINED_LENGTH)
+        out += struct.pack(order + 'HHI', 0xFFFE, 0xE000, ingest.UNDEFINED_LENGTH) + add(0x0028, 0x0010, b'US', us(7))
+        out += struct.pack(order + 'HHI', 0xFFFE, 0xE00D, 0) + struct.pack(order + 'HHI', 0xFFFE, 0xE0DD, 0)
+    out += add(0x0028, 0x0002, b'US', us(1))
+    out += add(0x0028, 0x0004, b'CS', 'MONOCHROME1' if monochrome1 else 'MONOCHROME2')
+    out += add(0x0028, 0x0010, b'US', us(pixels.shape[0])) + add(0x0028, 0x0011, b'US', us(pixels.shape[1]))
+    out += add(0x0028, 0x0100, b'US', us(16)) + add(0x0028, 0x0101, b'US', us(bits_stored))
+    out += add(0x0028, 0x0103, b'US', us(int(signed)))
+    if window:
+        out += add(0x0028, 0x1050, b'DS', str(window[0])) + add(0x0028, 0x1051, b'DS', str(window[1]))
+    out += add(0x0028, 0x1052, b'DS', '0') + add(0x0028, 0x1053, b'DS', '1')
+    out += add(0x7FE0, 0x0010, b'OW', pixels.astype(order + ('i2' if signed else 'u2')).tobytes())
+    return out
+
+
+def tiff(pixels):
+    # Uncompressed 16-bit little-endian TIFF, one strip
+    height, width = pixels.shape
+    data = pixels.astype('<u2').tobytes()
+    entries = [(256, 3, width), (257, 3, height), (258, 3, 16), (259, 3, 1), (262, 3, 1),
+               (273, 4, 8), (277, 3, 1), (278, 3, height), (279, 4, len(data))]
+    out = b'II*\0' + struct.pack('<I', 8 + len(data)) + data + struct.pack('<H', len(entries))
+    for tag, kind, value in entries:
+        out += struct.pack('<HHI', tag, kind, 1) + (struct.pack('<HH', value, 0) if kind == 3 else struct.pack('<I', value))
+    return out + b'\0\0\0\0'
+
+
+def windowed(values, center, width):
+    # Reference linear VOI window, DICOM PS3.3 C.11.2.1.2
+    low = center - 0.5 - (width - 1) / 2
+    return np.clip((values - low) / (width - 1) * 255 + 0.5, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture
+def pixels():
+    return np.random.default_rng(0).integers(0, 4096, (70, 30)).astype(np.uint16)
+
+
+@pytest.mark.parametrize('transfer_syntax', [ingest.EXPLICIT_VR_LE, ingest.IMPLICIT_VR_LE, ingest.EXPLICIT_VR_BE])
+def test_dicom_transfer_syntaxes(pixels, transfer_syntax):
+    data = dicom(pixels, transfer_syntax, window=(2048, 4096), sequence=True)
+    assert ingest.sniff(data) == 'dicom'
+    out = ingest.decode(data)
+    assert out.shape == pixels.shape
+    np.testing.assert_array_equal(out, windowed(pixels.astype(np.float64), 2048, 4096))
+
+
+def test_dicom_masks_bits_above_bits_stored(pixels):
+    # Overlay bits above the 12 stored ones are not pixel data
+    noisy = pixels | np.uint16(0xF000)
+    np.testing.assert_array_equal(ingest.decode(dicom(noisy, window=(2048, 4096))),
+                                  ingest.decode(dicom(pixels, window=(2048, 4096))))
+
+
+def test_dicom_signed_bits_stored_sign_extends():
+    values = np.array([[0x0FFF, 0x0800, 0x07FF, 0x0000]], dtype=np.uint16)
+    out = ingest.decode(dicom(values.view(np.int16), window=(0, 4096)))
+    np.testing.assert_array_equal(out, windowed(np.array([[-1, -2048, 2047, 0]], dtype=np.float64), 0, 4096))
+
+
+def test_dicom_monochrome1_is_inverted(pixels):
+    normal = ingest.decode(dicom(pixels, window=(2048, 4096)))
+    inverted = ingest.decode(dicom(pixels, window=(2048, 4096), monochrome1=True))
+    np.testing.assert_array_equal(inverted, 255 - normal)
+
+
+def test_dicom_without_window_uses_full_range(pixels):
+    out = ingest.decode(dicom(pixels))
+    assert out.min() == 0 and out.max() == 255
+    assert np.corrcoef(out.ravel(), pixels.ravel())[0, 1] > 0.99
+
+
+def test_tiff_16_bit(pixels):
+    data = tiff(pixels)
+    assert ingest.sniff(data) == 'tiff'
+    out = ingest.decode(data)
+    assert out.shape == pixels.shape and out.dtype == np.uint8
+    assert out.min() == 0 and out.max() == 255
+    assert np.corrcoef(out.ravel(), pixels.ravel())[0, 1] > 0.99
+
+
+def test_decode_rejects_other_formats():
+    assert ingest.sniff(b'\x89PNG\r\n\x1a\n') is None
+    with pytest.raises(ValueError):
+        ingest.decode(b'\x89PNG\r\n\x1a\n')
+
+
+def test_app_accepts_every_ingest_extension():
+    # Read from app.py without importing it (that would configure the database)
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')) as f:
+        tree = ast.parse(f.read())
+    allowed = next(ast.literal_eval(node.value) for node in ast.walk(tree)
+                   if isinstance(node, ast.Assign) and getattr(node.targets[0], 'id', None) == 'ALLOWED_EXTENSIONS')
+    assert ingest.EXTENSIONS <= allowed
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from jobs import InferenceScheduler, QueueFullError
+
+
+class Recorder:
+    # batch_fn that records its batches and can be held until released
+    def __init__(self, hold=False):
+        self.batches = []
+        self.entered = threading.Semaphore(0)
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self, images):
+        self.batches.append(list(images))
+        self.entered.release()
+        self.release.wait(10)
+        return [image * 2 for image in images]
+
+
+def wait_all(jobs, timeout=5):
+    for job in jobs:
+        assert job.wait(timeout)
+
+
+def test_full_batch_is_sent_without_waiting():
+    batch_fn = Recorder()
+    scheduler = InferenceScheduler(batch_fn, max_batch_size=3, max_wait=10)
+    start = time.monotonic()
+    jobs = [scheduler.submit(i) for i in range(3)]
+    wait_all(jobs)
+    assert time.monotonic() - start < 5
+    assert batch_fn.batches == [[0, 1, 2]]
+
+
+def test_partial_batch_is_sent_after_max_wait():
+    batch_fn = Recorder()
+    scheduler = InferenceScheduler(batch_fn, max_batch_size=8, max_wait=0.5)
+    jobs = [scheduler.submit(i) for i in range(2)]
+    wait_all(jobs)
+    assert batch_fn.batches == [[0, 1]]
+
+
+def test_submit_refuses_work_when_the_queue_is_full():
+    batch_fn = Recorder(hold=True)
+    scheduler = InferenceScheduler(batch_fn, max_batch_size=1, max_queue=2)
+    running = scheduler.submit(0)
+    assert batch_fn.entered.acquire(timeout=5)
+    queued = [scheduler.submit(1), scheduler.submit(2)]
+    with pytest.raises(QueueFullError):
+        scheduler.submit(3)
+    assert len(scheduler._jobs) == 3 and scheduler.pending() == 2
+    batch_fn.release.set()
+    wait_all([running] + queued)
+    assert [job.result for job in [running] + queued] == [0, 2, 4]
+
+
+def test_jobs_complete_with_results_or_errors():
+    scheduler = InferenceScheduler(lambda images: [image.upper() for image in images], max_wait=0)
+    job = scheduler.submit('ok')
+    wait_all([job])
+    assert (job.status, job.result, job.error) == ('done', 'OK', None)
+    assert scheduler.get(job.id) is job and job.image is None
+
+    def fail(images):
+        raise ValueError("model crashed")
+    failing = InferenceScheduler(fail, max_wait=0)
+    job = failing.submit('x')
+    wait_all([job])
+    assert (job.status, job.result, job.error) == ('failed', None, 'model crashed')
+
+
+def test_concurrency_keeps_several_batches_in_flight():
+    batch_fn = Recorder(hold=True)
+    scheduler = InferenceScheduler(batch_fn, max_batch_size=1, concurrency=2)
+    jobs = [scheduler.submit(i) for i in range(2)]
+    # Both batches entered batch_fn before either returned
+    assert batch_fn.entered.acquire(timeout=5) and batch_fn.entered.acquire(timeout=5)
+    batch_fn.release.set()
+    wait_all(jobs)
+    assert sorted(batch_fn.batches) == [[0], [1]]
+
+
+def test_finished_jobs_are_pruned_after_ttl():
+    scheduler = InferenceScheduler(lambda images: images, max_wait=0, job_ttl=10)
+    old = scheduler.submit('old')
+    wait_all([old])
+    old.finished -= 60
+    scheduler._last_prune = 0
+    new = scheduler.submit('new')
+    assert scheduler.get(old.id) is None and scheduler.get(new.id) is new
+
+
+def test_finished_jobs_are_pruned_while_idle():
+    scheduler = InferenceScheduler(lambda images: images, max_wait=0, job_ttl=0.2)
+    job = scheduler.submit('x')
+    wait_all([job])
+    deadline = time.monotonic() + 5
+    while scheduler.get(job.id) is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert scheduler.get(job.id) is None
@@ -0,0 +1,21 @@
+from metrics import Registry
+
+
+def test_drain_and_merge_carry_worker_metrics_over():
+    worker, web = Registry(), Registry()
+    worker.counter('errors_total', 'Errors').inc(stage='decode')
+    worker.histogram('stage_seconds', 'Stages', buckets=(0.1, 1.0)).observe(0.5, stage='inference')
+    web.histogram('stage_seconds', 'Stages', buckets=(0.1, 1.0)).observe(0.05, stage='inference')
+
+    web.merge(worker.drain())
+    text = web.render()
+    assert 'errors_total{stage="decode"} 1' in text
+    assert 'stage_seconds_bucket{stage="inference",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="inference",le="1.0"} 2' in text
+    assert 'stage_seconds_count{stage="inference"} 2' in text
+
+    # A drain starts the worker from zero, so nothing is counted twice
+    assert worker.drain() == []
+    worker.counter('errors_total', 'Errors').inc(stage='decode')
+    web.merge(worker.drain())
+    assert 'errors_total{stage="decode"} 2' in web.render()
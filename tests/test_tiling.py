@@ -0,0 +1,79 @@
+import numpy as np
+
+from tiling import merge_detections, tile_grid
+
+
+def covered(tiles, width, height):
+    mask = np.zeros((height, width), dtype=bool)
+    for x1, y1, x2, y2 in tiles:
+        mask[y1:y2, x1:x2] = True
+    return mask.all()
+
+
+def test_tile_grid_small_image_is_one_tile():
+    assert tile_grid(500, 400, 640) == [(0, 0, 500, 400)]
+
+
+def test_tile_grid_edge_tiles_end_at_the_image_edge():
+    tiles = tile_grid(3000, 2500, 640, overlap=0.2)
+    assert covered(tiles, 3000, 2500)
+    # Full-size tiles everywhere, the last row and column flush with the edge
+    assert all(x2 - x1 == 640 and y2 - y1 == 640 for x1, y1, x2, y2 in tiles)
+    assert max(x2 for _, _, x2, _ in tiles) == 3000
+    assert max(y2 for _, _, _, y2 in tiles) == 2500
+    xs = sorted({x1 for x1, _, _, _ in tiles})
+    assert xs[0] == 0 and xs[-1] == 3000 - 640
+    # Neighbours overlap by at least overlap * tile_size
+    assert all(b - a <= 512 for a, b in zip(xs, xs[1:]))
+
+
+def test_tile_grid_one_side_larger_than_tile():
+    tiles = tile_grid(1000, 300, 640, overlap=0.2)
+    assert tiles == [(0, 0, 640, 300), (360, 0, 1000, 300)]
+
+
+def test_tile_grid_exact_multiple_has_no_duplicate_tile():
+    tiles = tile_grid(1280, 640, 640, overlap=0)
+    assert tiles == [(0, 0, 640, 640), (640, 0, 1280, 640)]
+
+
+def rows(*boxes):
+    return np.array(boxes, dtype=np.float32)
+
+
+def test_merge_detections_suppresses_duplicates_of_the_same_class():
+    merged = merge_detections(rows([0, 0, 100, 100, 0.9, 1], [5, 5, 100, 100, 0.8, 1], [0, 0, 100, 100, 0.7, 2]))
+    np.testing.assert_array_equal(merged, rows([0, 0, 100, 100, 0.9, 1], [0, 0, 100, 100, 0.7, 2]))
+
+
+def test_merge_detections_keeps_separate_boxes():
+    boxes = rows([0, 0, 100, 100, 0.9, 1], [300, 300, 400, 400, 0.5, 1])
+    np.testing.assert_array_equal(merge_detections(boxes), boxes)
+
+
+def test_merge_detections_joins_a_fracture_cut_by_a_tile_edge():
+    # A fracture spanning x = 600..700 seen by the overview pass as a whole
+    # and by the left tile (ending at x = 640) as a confident fragment
+    whole = [600, 100, 700, 200, 0.6, 3]
+    fragment = [600, 100, 640, 200, 0.9, 3]
+    merged = merge_detections(rows(fragment, whole))
+    # One box, with the fragment's confidence and the full extent
+    np.testing.assert_array_equal(merged, rows([600, 100, 700, 200, 0.9, 3]))
+
+
+def test_merge_detections_joins_fragments_from_both_sides_of_an_edge():
+    whole = [600, 100, 700, 200, 0.95, 3]
+    left = [600, 100, 640, 200, 0.9, 3]
+    right = [640, 100, 700, 200, 0.8, 3]
+    np.testing.assert_array_equal(merge_detections(rows(left, right, whole)), rows(whole))
+
+
+def test_merge_detections_does_not_join_fragments_of_another_class():
+    whole = [600, 100, 700, 200, 0.6, 3]
+    fragment = [600, 100, 640, 200, 0.9, 2]
+    # Both kept unchanged, highest confidence first
+    np.testing.assert_array_equal(merge_detections(rows(whole, fragment)), rows(fragment, whole))
+
+
+def test_merge_detections_empty():
+    assert len(merge_detections(np.empty((0, 6), dtype=np.float32))) == 0
@@ -0,0 +1,86 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from views import ViewStore, content_key
+
+NOW = time.time()
+DETECTIONS = [(10, 10, 40, 40, 0.9, 'wrist positive')]
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    def make(**kwargs):
+        kwargs.setdefault('max_source_bytes', 0)
+        return ViewStore(root=str(tmp_path / 'processed'), source_root=str(tmp_path / 'uploads'),
+                         async_writes=False, gc_interval=60, **kwargs)
+    return make
+
+
+def image(value):
+    return np.full((64, 64, 3), value, dtype=np.uint8)
+
+
+def add(store, key, value, age=0):
+    # A result with its source and a rendered view, last used age seconds ago
+    store.register(key, DETECTIONS, image=image(value))
+    store.get('processed', key)
+    source = source_of(store, value)
+    for path in [store._meta_path(key), store.path('processed', key), source]:
+        os.utime(path, (NOW - age, NOW - age))
+    return source
+
+
+def source_of(store, value):
+    return store._source_path(content_key(image(value)))
+
+
+def exists(store, key):
+    return os.path.exists(store._meta_path(key)) and os.path.exists(store.path('processed', key))
+
+
+def test_collect_expires_results_after_ttl(make_store):
+    store = make_store(ttl=3600)
+    old_source = add(store, 'old1', 1, age=7200)
+    new_source = add(store, 'new2', 2, age=60)
+    assert store.collect(NOW) > 0
+    assert not exists(store, 'old1') and not os.path.exists(old_source)
+    assert exists(store, 'new2') and os.path.exists(new_source)
+
+
+def test_collect_drops_least_recently_used_down_to_max_bytes(make_store):
+    store = make_store()
+    sources = [add(store, 'key%d' % i, i, age=age) for i, age in enumerate([300, 200, 100], 1)]
+    one = sum(os.path.getsize(p) for p in [store._meta_path('key1'), store.path('processed', 'key1'), sources[0]])
+    store.max_bytes = 2 * one + one // 2
+    store.collect(NOW)
+    assert not exists(store, 'key1')
+    assert exists(store, 'key2') and exists(store, 'key3')
+
+
+def test_collect_keeps_sources_still_referenced(make_store):
+    store = make_store(ttl=3600)
+    source = add(store, 'old1', 1, age=7200)
+    # A newer result for the same image points at the same stored source
+    store.register('new1', DETECTIONS, image=image(1))
+    store.collect(NOW)
+    assert not exists(store, 'old1')
+    assert os.path.exists(store._meta_path('new1')) and os.path.exists(source)
+
+
+def test_collect_spares_results_in_memory_and_recent_sources(make_store):
+    store = make_store(ttl=3600, max_source_bytes=1024 * 1024)
+    add(store, 'mem1', 1, age=7200)
+    # An upload written a moment ago whose result is not registered yet
+    recent = os.path.join(store.source_root, 'recent')
+    with open(recent, 'wb') as f:
+        f.write(b'upload')
+    store.collect(NOW)
+    assert exists(store, 'mem1') and os.path.exists(source_of(store, 1))
+    assert os.path.exists(recent)
+    # Old enough and still unreferenced, it goes
+    os.utime(recent, (NOW - 120, NOW - 120))
+    store.collect(NOW)
+    assert not os.path.exists(recent)
@@ -0,0 +1,62 @@
+import numpy as np
+
+# Sliced inference helpers. Large radiographs are cut into overlapping
+# tiles that are each run at the model's input size, so small fractures are
+# not shrunk away; the per-tile boxes are then moved back to image
+# coordinates and merged across tiles.
+
+
+def tile_grid(width, height, tile_size, overlap=0.2):
+    # (x1, y1, x2, y2) of tiles covering the image, neighbours overlapping by
+    # about overlap * tile_size; the last row and column end at the image edge
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def merge_detections(rows, iou_threshold=0.45, ios_threshold=0.8):
+    # Class-aware greedy NMS over rows of (x1, y1, x2, y2, conf, cls).
+    # A box is suppressed by a higher-confidence box of the same class when
+    # their IoU exceeds iou_threshold, or when most of it lies inside that
+    # box (intersection over the smaller area above ios_threshold), which is
+    # what a fracture cut by a tile edge looks like next to the full box;
+    # the kept box then grows to cover both, so a confident fragment does
+    # not shrink the fracture to one tile's part of it.
+    if len(rows) == 0:
+        return rows
+    order = np.argsort(-rows[:, 4], kind='stable')
+    x1, y1, x2, y2 = rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+    area = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    cls = rows[:, 5]
+    merged = rows.copy()
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        same = cls[rest] == cls[i]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        with np.errstate(divide='ignore', invalid='ignore'):
+            iou = inter / (area[i] + area[rest] - inter)
+            ios = inter / np.minimum(area[i], area[rest])
+        duplicate = same & (iou > iou_threshold)
+        fragment = same & ~duplicate & (ios > ios_threshold)
+        if fragment.any():
+            parts = rest[fragment]
+            merged[i, 0] = min(x1[i], x1[parts].min())
+            merged[i, 1] = min(y1[i], y1[parts].min())
+            merged[i, 2] = max(x2[i], x2[parts].max())
+            merged[i, 3] = max(y2[i], y2[parts].max())
+        order = rest[~(duplicate | fragment)]
+    return merged[keep]
@@ -0,0 +1,417 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import metrics
+from metrics import span
+
+VIEWS = ('original', 'grayscale', 'thresholded', 'binary', 'processed')
+
+# Encodings views can be stored in: file extension, mimetype
+FORMATS = {'png': ('png', 'image/png'), 'webp': ('webp', 'image/webp'), 'jpeg': ('jpg', 'image/jpeg')}
+
+# Stored originals browsers can show as they are, by leading bytes
+SOURCE_MIMETYPES = ((b'\x89PNG\r\n\x1a\n', 'image/png'), (b'\xff\xd8\xff', 'image/jpeg'))
+
+gc_deleted_bytes = metrics.registry.counter('artifact_gc_deleted_bytes_total', 'Bytes removed from the artifact store by garbage collection')
+
+# Box colours per class (BGR as drawn by OpenCV), first match wins
+CLASS_COLORS = [
+    ('elbow', (255, 0, 0)),
+    ('fingers', (0, 255, 0)),
+    ('forearm', (255, 165, 0)),
+    ('humerus', (128, 0, 128)),
+    ('shoulder', (255, 255, 0)),
+    ('wrist', (255, 192, 203))
+]
+
+
+def class_color(class_name):
+    for part, color in CLASS_COLORS:
+        if part in class_name:
+            return color
+    return (0, 0, 255)
+
+
+def draw_detections(result_img, detections):
+    for x1, y1, x2, y2, conf, class_name in detections:
+        color = class_color(class_name)
+        cv2.rectangle(result_img, (x1, y1), (x2, y2), color, 2)
+        label = f'{class_name} {conf:.2f}'
+        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+        cv2.rectangle(result_img, (x1, y1-20), (x1+w, y1), color, -1)
+        cv2.putText(result_img, label, (x1, y1-5),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+        center_x = (x1 + x2) // 2
+        center_y = (y1 + y2) // 2
+        cross_size = 10
+        cv2.line(result_img,
+               (center_x - cross_size, center_y),
+               (center_x + cross_size, center_y),
+               color, 2)
+        cv2.line(result_img,
+               (center_x, center_y - cross_size),
+               (center_x, center_y + cross_size),
+               color, 2)
+    return result_img
+
+
+def render_view(view, original_img, detections):
+    if view == 'original':
+        return original_img
+    if original_img.ndim == 2:
+        # DICOM/TIFF studies are kept as single-channel 8-bit images
+        if view == 'processed':
+            return draw_detections(cv2.cvtColor(original_img, cv2.COLOR_GRAY2BGR), detections)
+        gray = original_img
+    elif view == 'processed':
+        return draw_detections(original_img.copy(), detections)
+    else:
+        gray = cv2.cvtColor(original_img, cv2.COLOR_BGR2GRAY)
+    if view == 'grayscale':
+        return gray
+    if view == 'thresholded':
+        # Otsu's threshold
+        _, thresh_img = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return thresh_img
+    if view == 'binary':
+        # Simple binary threshold
+        _, binary_img = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+        return binary_img
+    raise KeyError(view)
+
+
+def _tmp_suffix():
+    # Pool worker processes write into the same folders, and thread ids
+    # repeat across processes
+    return f'{os.getpid()}.{threading.get_ident()}'
+
+
+def content_key(data):
+    # Name derived from the content, so identical uploads share one file and
+    # different ones never collide
+    digest = hashlib.sha256()
+    if hasattr(data, 'dtype'):
+        digest.update(f'{data.shape}{data.dtype}'.encode())
+        data = np.ascontiguousarray(data)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class ViewStore:
+    # Derived images (grayscale, thresholds, annotated result) are only
+    # rendered when a browser asks for them. Inference registers the source
+    # image and its detections under a key; the first request for a view
+    # renders and encodes it into root, later requests are served from disk.
+    # Sources without a file on disk are kept in memory (the most recent
+    # ones, up to max_source_bytes of decoded pixels) and, if
+    # persist_sources is set, written to source_root in the background,
+    # named by the hash of their content. The original view is that stored
+    # file itself when it is a PNG or JPEG, so it is never re-encoded.
+    #
+    # Views are encoded as image_format ('png', 'webp' or 'jpeg') with
+    # quality (WebP/JPEG, above 100 is lossless WebP) or png_compression
+    # (0-9). With max_bytes or ttl set, start_gc() starts a background thread
+    # that deletes results (metadata plus rendered views) not used for ttl
+    # seconds, then the least recently used ones until both folders fit in
+    # max_bytes, then sources no result refers to any more.
+    def __init__(self, root=os.path.join('static', 'processed'), source_root=os.path.join('static', 'uploads'),
+                 max_source_bytes=256 * 1024 * 1024, persist_sources=True, async_writes=True, image_format='png',
+                 png_compression=None, quality=None, max_bytes=None, ttl=None, gc_interval=300):
+        # Absolute, so the paths handed out stay valid for send_file (which
+        # resolves relative ones against the app's root_path, not the cwd)
+        self.root = os.path.abspath(root)
+        self.source_root = os.path.abspath(source_root)
+        self.max_source_bytes = max_source_bytes
+        self.persist_sources = persist_sources
+        self.async_writes = async_writes
+        self.extension, self.mimetype = FORMATS[image_format]
+        self.encode_params = []
+        if image_format == 'png' and png_compression is not None:
+            self.encode_params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+        elif image_format == 'webp' and quality is not None:
+            self.encode_params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+        elif image_format == 'jpeg' and quality is not None:
+            self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self._sources = OrderedDict()
+        self._source_bytes = 0
+        # Source writes still queued on the writer, by path
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='view-writer')
+        self._gc_stop = threading.Event()
+        self._gc_thread = None
+
+    def url(self, view, key):
+        return f'/processed/{view}/{key}'
+
+    def path(self, view, key):
+        return os.path.join(self.root, f'{view}_{key}.{self.extension}')
+
+    def _meta_path(self, key):
+        return os.path.join(self.root, f'{key}.json')
+
+    def _source_path(self, digest):
+        return os.path.join(self.source_root, digest)
+
+    def _touch(self, key):
+        # Marks a result as recently used for garbage collection
+        try:
+            os.utime(self._meta_path(key))
+        except OSError:
+            pass
+
+    def register(self, key, detections, image=None, source_path=None, source=None):
+        # source_path points at an already persisted original; otherwise the
+        # decoded image is kept in memory and the original upload bytes (or
+        # the image itself) are written off the request path.
+        os.makedirs(self.root, exist_ok=True)
+        if source_path is None:
+            if source is None:
+                source = image
+            source_path = self._source_path(content_key(source) if source is not None else key)
+            if self.persist_sources and not os.path.exists(source_path):
+                if source is not None and self.async_writes:
+                    with self._lock:
+                        self._pending[source_path] = self._writer.submit(self._write_source, source_path, source)
+                elif source is not None:
+                    self._write_source(source_path, source)
+        meta = {'source': source_path, 'detections': [list(d) for d in detections]}
+        try:
+            with open(self._meta_path(key)) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        if previous is not None and previous.get('detections') != meta['detections']:
+            # Same image, different detections (new settings): drop the stale renders
+            self._remove_views(key)
+        tmp_path = f'{self._meta_path(key)}.{_tmp_suffix()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(key))
+        if image is not None and image.nbytes <= self.max_source_bytes:
+            with self._lock:
+                previous = self._sources.pop(key, None)
+                if previous is not None:
+                    self._source_bytes -= previous.nbytes
+                self._sources[key] = image
+                self._source_bytes += image.nbytes
+                while self._source_bytes > self.max_source_bytes:
+                    self._source_bytes -= self._sources.popitem(last=False)[1].nbytes
+
+    def available(self, key):
+        # True if views for key can still be rendered (or already were)
+        with self._lock:
+            if key in self._sources:
+                return os.path.exists(self._meta_path(key))
+        try:
+            with open(self._meta_path(key)) as f:
+                if not os.path.exists(json.load(f)['source']):
+                    return False
+        except (OSError, ValueError, KeyError):
+            return False
+        self._touch(key)
+        return True
+
+    def mimetype_of(self, path):
+        # Rendered views use the store's format; originals are the stored upload
+        if os.path.dirname(os.path.abspath(path)) == self.root:
+            return self.mimetype
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(8)
+        except OSError:
+            return None
+        for magic, mimetype in SOURCE_MIMETYPES:
+            if head.startswith(magic):
+                return mimetype
+        return None
+
+    def _stored_original(self, source_path):
+        # The persisted upload when a browser can show it directly, waiting
+        # for its background write if that is still queued
+        with self._lock:
+            pending = self._pending.get(source_path)
+        if pending is not None:
+            pending.result()
+        if os.path.exists(source_path) and self.mimetype_of(source_path):
+            return source_path
+        return None
+
+    def key_from_url(self, url):
+        return url.rsplit('/', 1)[-1]
+
+    def get(self, view, key):
+        # Returns the path of the encoded view, rendering it on first access
+        if view not in VIEWS:
+            raise KeyError(view)
+        path = self.path(view, key)
+        if os.path.exists(path):
+            self._touch(key)
+            return path
+
+        try:
+            with open(self._meta_path(key)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(key)
+        # Metadata written before the roots were absolute holds cwd-relative paths
+        meta['source'] = os.path.abspath(meta['source'])
+        if view == 'original':
+            stored = self._stored_original(meta['source'])
+            if stored is not None:
+                self._touch(key)
+                return stored
+        detections = [(int(x1), int(y1), int(x2), int(y2), float(conf), class_name)
+                      for x1, y1, x2, y2, conf, class_name in meta['detections']]
+
+        with self._lock:
+            original_img = self._sources.get(key)
+        if original_img is None:
+            original_img = cv2.imread(meta['source'], cv2.IMREAD_COLOR)
+            if original_img is None:
+                raise KeyError(key)
+
+        tmp_path = f'{path}.{_tmp_suffix()}.tmp.{self.extension}'
+        with span(f'render_{view}'):
+            rendered = render_view(view, original_img, detections)
+        with span('encode_write'):
+            cv2.imwrite(tmp_path, rendered, self.encode_params)
+            os.replace(tmp_path, path)
+        self._touch(key)
+        return path
+
+    def _remove_views(self, key):
+        for view in VIEWS:
+            for extension, _ in FORMATS.values():
+                try:
+                    os.remove(os.path.join(self.root, f'{view}_{key}.{extension}'))
+                except OSError:
+                    pass
+
+    def _gc_loop(self):
+        while not self._gc_stop.wait(self.gc_interval):
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Error collecting artifacts: {str(e)}")
+
+    def start_gc(self):
+        # Only the process serving the store collects; tools that merely
+        # import predict (bulk scans, benchmarks, pool workers) never start it
+        with self._lock:
+            if (self.max_bytes or self.ttl) and self._gc_thread is None:
+                self._gc_thread = threading.Thread(target=self._gc_loop, name='artifact-gc', daemon=True)
+                self._gc_thread.start()
+
+    def stop_gc(self):
+        self._gc_stop.set()
+
+    def collect(self, now=None):
+        # One garbage collection pass; returns the number of bytes deleted
+        now = now or time.time()
+        results = {}
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            entries = []
+        for entry in entries:
+            name, _, extension = entry.name.rpartition('.')
+            if not name or '.tmp' in entry.name:
+                continue
+            key = name if extension == 'json' else name.partition('_')[2]
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            result = results.setdefault(key, {'files': [], 'size': 0, 'used': 0, 'source': None})
+            result['files'].append(entry.path)
+            result['size'] += st.st_size
+            if extension == 'json':
+                result['used'] = st.st_mtime
+                try:
+                    with open(entry.path) as f:
+                        result['source'] = json.load(f)['source']
+                except (OSError, ValueError, KeyError):
+                    pass
+
+        sources = {}
+        try:
+            for entry in os.scandir(self.source_root):
+                if not entry.name.endswith('.tmp'):
+                    st = entry.stat()
+                    sources[entry.path] = (st.st_size, st.st_mtime)
+        except OSError:
+            pass
+
+        deleted = 0
+        with self._lock:
+            in_memory = set(self._sources)
+
+        def drop(key):
+            nonlocal deleted
+            for path in results.pop(key)['files']:
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    deleted += size
+                except OSError:
+                    pass
+
+        # Results whose metadata was never written (or is gone) are stray renders
+        for key in [k for k, r in results.items() if not r['used'] and k not in in_memory]:
+            drop(key)
+        if self.ttl:
+            for key in [k for k, r in results.items() if r['used'] < now - self.ttl and k not in in_memory]:
+                drop(key)
+        if self.max_bytes:
+            total = sum(r['size'] for r in results.values()) + sum(size for size, _ in sources.values())
+            for key in sorted(results, key=lambda k: results[k]['used']):
+                if total <= self.max_bytes:
+                    break
+                if key not in in_memory:
+                    total -= results[key]['size']
+                    drop(key)
+
+        # Sources no remaining result points at; recent ones may still be
+        # waiting for their result's metadata to be written
+        referenced = {os.path.abspath(r['source']) for r in results.values() if r['source']}
+        for path, (size, mtime) in sources.items():
+            if path not in referenced and mtime < now - self.gc_interval:
+                try:
+                    os.remove(path)
+                    deleted += size
+                except OSError:
+                    pass
+
+        gc_deleted_bytes.inc(deleted)
+        return deleted
+
+    def _write_source(self, path, image):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if isinstance(image, np.ndarray):
+                # Lossless copy so rendered views match the in-memory original
+                ok, encoded = cv2.imencode('.png', image)
+                if not ok:
+                    return
+                image = encoded.tobytes()
+            tmp_path = f'{path}.{_tmp_suffix()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(bytes(image))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error writing source image: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)